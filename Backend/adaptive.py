@@ -0,0 +1,216 @@
+"""
+Adaptive placement tests using item response theory.
+
+Each question is an IRT item with discrimination a, difficulty b and
+guessing c (3PL; c = 0 is the 2PL model), read from the optional
+"discrimination", "difficulty" and "guessing" fields of the question and
+defaulting to a = 1, b = 0, c = 0.
+
+When a bank is compiled, the response probability and the Fisher
+information of every item are tabulated over a fixed ability grid, along
+with each item's order by information at every grid point. During a test:
+
+  - the next item is the most informative unused item at the grid point
+    nearest the current ability estimate: a walk down a precomputed order
+    that stops at the first unused item;
+  - the ability estimate is the posterior mean (EAP) over the grid, updated
+    after each answer by adding the item's tabulated log-likelihood row;
+  - the test stops once the placement is settled (the posterior puts
+    PLACEMENT_CONFIDENCE of its mass on one level), the standard error
+    drops to TARGET_SE, or MAX_ITEMS have been asked.
+
+The level for an ability is determine_category of the expected accuracy on
+the whole bank at that ability, so placements agree with /api/submit.
+"""
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from answer_key import answer_key
+from utils import determine_category
+
+THETA_GRID = np.linspace(-4.0, 4.0, 81)
+
+TARGET_SE = 0.3
+PLACEMENT_CONFIDENCE = 0.9
+MAX_ITEMS = 20
+
+# Tests left unfinished are dropped, least recently used first, past this
+MAX_ACTIVE_TESTS = 10000
+
+class ItemParams(NamedTuple):
+    a: float
+    b: float
+    c: float
+
+def item_params(question: dict) -> ItemParams:
+    return ItemParams(
+        a=float(question.get("discrimination", 1.0)),
+        b=float(question.get("difficulty", 0.0)),
+        c=float(question.get("guessing", 0.0)),
+    )
+
+class ItemBank:
+    """
+    IRT tables for one topic's questions. Built once per version of the
+    question list and read-only afterwards.
+    """
+
+    def __init__(self, questions: List[dict]):
+        self.questions = questions
+        self.ids = [int(q["id"]) for q in questions]
+        self.index = {q_id: i for i, q_id in enumerate(self.ids)}
+        params = np.array([item_params(q) for q in questions], dtype=np.float64).reshape(-1, 3)
+        a, b, c = (params[:, i:i + 1] for i in range(3))
+
+        # [item, grid point]
+        p = c + (1 - c) / (1 + np.exp(-a * (THETA_GRID - b)))
+        p = np.clip(p, 1e-9, 1 - 1e-9)
+        q = 1 - p
+        self.log_p = np.log(p)
+        self.log_q = np.log(q)
+        information = a ** 2 * (q / p) * ((p - c) / (1 - c)) ** 2
+        # [grid point] -> item positions, most informative first
+        self.order = np.argsort(-information, axis=0, kind="stable").T.copy()
+
+        # Level at each grid point, from the expected accuracy on the bank
+        expected_accuracy = p.mean(axis=0) if len(questions) else np.zeros(len(THETA_GRID))
+        categories = [determine_category(float(x)) for x in expected_accuracy]
+        self.levels = list(dict.fromkeys(categories))
+        self.level_at = np.array([self.levels.index(c) for c in categories])
+
+    def next_item(self, theta: float, used: set) -> Optional[int]:
+        """
+        Position of the most informative item at theta not in used.
+        """
+        k = int(np.abs(THETA_GRID - theta).argmin())
+        for i in self.order[k]:
+            if i not in used:
+                return int(i)
+        return None
+
+# Standard normal prior over the grid
+LOG_PRIOR = -0.5 * THETA_GRID ** 2
+
+class AdaptiveTest:
+    def __init__(self, test_id: str, username: str, topic: str, bank: ItemBank):
+        self.id = test_id
+        self.username = username
+        self.topic = topic
+        self.bank = bank
+        self.log_posterior = LOG_PRIOR.copy()
+        self.used: set = set()
+        self.responses: List[Tuple[int, bool]] = []
+        self.theta = 0.0
+        self.se = 1.0
+        self.current: Optional[int] = bank.next_item(self.theta, self.used)
+        self.done = self.current is None
+        self.category: Optional[str] = None
+        self.level_probability = 0.0
+
+    def _posterior(self) -> np.ndarray:
+        weights = np.exp(self.log_posterior - self.log_posterior.max())
+        return weights / weights.sum()
+
+    def answer(self, correct: bool):
+        i = self.current
+        self.used.add(i)
+        self.responses.append((self.bank.ids[i], correct))
+        self.log_posterior += self.bank.log_p[i] if correct else self.bank.log_q[i]
+
+        posterior = self._posterior()
+        self.theta = float(posterior @ THETA_GRID)
+        self.se = float(np.sqrt(posterior @ (THETA_GRID - self.theta) ** 2))
+        level_mass = np.bincount(self.bank.level_at, weights=posterior, minlength=len(self.bank.levels))
+        best = int(level_mass.argmax())
+        self.category = self.bank.levels[best]
+        self.level_probability = float(level_mass[best])
+
+        self.current = None
+        if self.level_probability < PLACEMENT_CONFIDENCE and self.se > TARGET_SE and len(self.responses) < MAX_ITEMS:
+            self.current = self.bank.next_item(self.theta, self.used)
+        self.done = self.current is None
+
+    def question(self) -> Optional[dict]:
+        if self.current is None:
+            return None
+        q = self.bank.questions[self.current]
+        return {"id": q["id"], "text": q["text"], "options": q["options"], "hint": q.get("hint")}
+
+    def state(self) -> dict:
+        return {
+            "test_id": self.id,
+            "topic": self.topic,
+            "done": self.done,
+            "question": self.question(),
+            "answered": len(self.responses),
+            "correct": sum(1 for _, ok in self.responses if ok),
+            "ability": round(self.theta, 4),
+            "standard_error": round(self.se, 4),
+            "category": self.category,
+            "category_probability": round(self.level_probability, 4),
+        }
+
+class AdaptiveEngine:
+    def __init__(self, max_active: int = MAX_ACTIVE_TESTS):
+        self.max_active = max_active
+        # topic -> (question list the bank was built from, bank)
+        self._banks: Dict[str, Tuple[List[dict], ItemBank]] = {}
+        self._tests: "OrderedDict[str, AdaptiveTest]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.finished = 0
+        self.items_to_finish = 0
+
+    def bank(self, topic: str, questions: List[dict]) -> ItemBank:
+        # save_questions replaces a topic's list, so identity marks a version
+        cached = self._banks.get(topic)
+        if cached is None or cached[0] is not questions:
+            cached = self._banks[topic] = (questions, ItemBank(questions))
+        return cached[1]
+
+    def start(self, username: str, topic: str, questions: List[dict]) -> AdaptiveTest:
+        test = AdaptiveTest(secrets.token_urlsafe(16), username, topic, self.bank(topic, questions))
+        with self._lock:
+            self._tests[test.id] = test
+            if len(self._tests) > self.max_active:
+                self._tests.popitem(last=False)
+            self.started += 1
+        return test
+
+    def get(self, test_id: str, username: str) -> Optional[AdaptiveTest]:
+        with self._lock:
+            test = self._tests.get(test_id)
+            if test is None or test.username != username:
+                return None
+            self._tests.move_to_end(test_id)
+            return test
+
+    def answer(self, test: AdaptiveTest, q_id: int, selected: Union[int, str]):
+        """
+        Grades the answer to the current question. Raises ValueError if q_id
+        isn't the question being asked.
+        """
+        with self._lock:
+            if test.done or test.bank.ids[test.current] != q_id:
+                raise ValueError("Not the current question")
+            test.answer(answer_key.is_correct(test.topic, q_id, selected))
+            if test.done:
+                self._tests.pop(test.id, None)
+                self.finished += 1
+                self.items_to_finish += len(test.responses)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": len(self._tests),
+                "started": self.started,
+                "finished": self.finished,
+                "avg_items": round(self.items_to_finish / self.finished, 2) if self.finished else 0.0,
+                "banks": len(self._banks),
+            }
+
+adaptive_engine = AdaptiveEngine()
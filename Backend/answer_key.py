@@ -0,0 +1,128 @@
+"""
+Compiled answer keys for grading.
+
+Every question bank is compiled once into topic -> question id -> KeyEntry,
+so checking an answer is two dict lookups whatever the bank size. Banks
+held by the question store are recompiled when a topic is saved; file
+banks (Data/questions.json) are recompiled only when the file changes.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+class KeyEntry(NamedTuple):
+    correct_index: int
+    correct_option: Optional[str]
+    # Every option's text, so a text answer is never read as a letter label
+    option_texts: FrozenSet[str] = frozenset()
+
+def compile_questions(questions: Iterable[dict]) -> Dict[int, KeyEntry]:
+    table = {}
+    for q in questions:
+        correct_index = q.get("correct_index")
+        if correct_index is None:
+            continue
+        options = q.get("options") or []
+        correct_option = options[correct_index] if 0 <= correct_index < len(options) else None
+        table[int(q["id"])] = KeyEntry(correct_index, correct_option, frozenset(str(o) for o in options))
+    return table
+
+def matches(entry: KeyEntry, selected: Union[int, str]) -> bool:
+    # Clients send the option index, the option text, or a letter label
+    if isinstance(selected, int):
+        return selected == entry.correct_index
+    if selected == entry.correct_option:
+        return True
+    if selected in entry.option_texts:
+        return False
+    if len(selected) == 1 and "A" <= selected.upper() <= "Z":
+        return ord(selected.upper()) - ord("A") == entry.correct_index
+    return False
+
+class AnswerKey:
+    def __init__(self):
+        # Each topic's table is replaced whole, never mutated
+        self._topics: Dict[Optional[str], Dict[int, KeyEntry]] = {}
+
+    def load_topic(self, topic: Optional[str], questions: Iterable[dict]):
+        self._topics[topic] = compile_questions(questions)
+
+    def remove_topic(self, topic: Optional[str]):
+        self._topics.pop(topic, None)
+
+    def lookup(self, topic: Optional[str], q_id: int) -> Optional[KeyEntry]:
+        table = self._topics.get(topic)
+        return table.get(q_id) if table is not None else None
+
+    def is_correct(self, topic: Optional[str], q_id: int, selected: Union[int, str]) -> bool:
+        entry = self.lookup(topic, q_id)
+        return entry is not None and matches(entry, selected)
+
+    def table(self, topic: Optional[str]) -> Dict[int, KeyEntry]:
+        """
+        The compiled table for a topic. Treat as read-only; it is replaced,
+        not updated, when the bank changes.
+        """
+        return self._topics.get(topic) or {}
+
+    def size(self, topic: Optional[str]) -> int:
+        return len(self._topics.get(topic) or ())
+
+class FileBank:
+    """
+    A question list in a JSON file, compiled into an AnswerKey under one
+    topic. The file is stat'ed at most every check_interval seconds and
+    reloaded only when its mtime or size changes.
+    """
+
+    def __init__(self, path: str, key: AnswerKey, topic: Optional[str] = None, check_interval: float = 1.0):
+        self.path = path
+        self.key = key
+        self.topic = topic
+        self.check_interval = check_interval
+        self._version: Optional[Tuple[int, int]] = None
+        self._questions: List[dict] = []
+        self._public: List[dict] = []
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._version is not None:
+                    self._version = None
+                    self._questions = []
+                    self._public = []
+                    self.key.remove_topic(self.topic)
+                return
+            version = (st.st_mtime_ns, st.st_size)
+            if version == self._version:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                questions = json.load(f)
+            self.key.load_topic(self.topic, questions)
+            self._questions = questions
+            # Without the answers, for the frontend
+            self._public = [{k: v for k, v in q.items() if k != "correct_index"} for q in questions]
+            self._version = version
+
+    def questions(self) -> List[dict]:
+        self._refresh()
+        return self._questions
+
+    def public_questions(self) -> List[dict]:
+        self._refresh()
+        return self._public
+
+# Shared by main, database and the routers
+answer_key = AnswerKey()
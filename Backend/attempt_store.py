@@ -0,0 +1,239 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from models import Answer, Attempt
+
+ATTEMPTS_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "attempts.db")
+# How long the writer waits for more submissions before committing
+FLUSH_INTERVAL = 0.005
+# Upper bound on attempts per transaction
+MAX_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    score REAL,
+    category TEXT,
+    -- ISO 8601 UTC with fixed precision, so text order is time order
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_user_created ON attempts (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS answers (
+    attempt_id INTEGER NOT NULL REFERENCES attempts (id),
+    q_id INTEGER NOT NULL,
+    selected TEXT NOT NULL,
+    time REAL NOT NULL,
+    confidence INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_attempt ON answers (attempt_id);
+"""
+
+def encode_cursor(created_at: str, attempt_id: int) -> str:
+    raw = json.dumps([created_at, attempt_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Raises ValueError for anything that isn't a cursor we handed out.
+    """
+    try:
+        created_at, attempt_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(attempt_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, attempt_id
+
+class AttemptStore:
+    """
+    Quiz attempts and their answers in SQLite (WAL mode).
+
+    add() queues an attempt and returns a Future. One writer thread inserts
+    everything queued during the last flush_interval in a single
+    transaction and resolves the Futures once it has committed. Reads use
+    their own connection per thread, which WAL lets run alongside the writer.
+    """
+
+    def __init__(self, path: str = ATTEMPTS_DB_FILE, flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Attempt, Future, float]] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._writer: Optional[threading.Thread] = None
+        self._local = threading.local()
+        # Group commit metrics
+        self.flushes = 0
+        self.records = 0
+        self.max_batch_seen = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL is durable across application crashes, and commits
+        # don't fsync the main database file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._closing = False
+        self._writer = threading.Thread(target=self._run_writer, args=(conn,), name="attempt-writer", daemon=True)
+        self._writer.start()
+
+    def add(self, attempt: Attempt) -> Future:
+        """
+        Queues an attempt; the Future resolves once it is committed.
+        """
+        future = Future()
+        with self._cond:
+            if self._closing or self._writer is None:
+                raise RuntimeError(f"{self.path} is not open")
+            self._pending.append((attempt, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def _run_writer(self, conn: sqlite3.Connection):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    break
+            if self.flush_interval > 0 and not self._closing:
+                # Let concurrent submissions join this transaction
+                time.sleep(self.flush_interval)
+            with self._cond:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._flush(conn, batch)
+        conn.close()
+
+    def _flush(self, conn: sqlite3.Connection, batch: List[Tuple[Attempt, Future, float]]):
+        started = time.perf_counter()
+        try:
+            with conn:
+                cur = conn.cursor()
+                answer_rows = []
+                for attempt, _, _ in batch:
+                    cur.execute(
+                        "INSERT INTO attempts (user_id, topic, score, category, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (attempt.user_id, attempt.topic, attempt.score, attempt.category, attempt.created_at.isoformat(timespec="microseconds")),
+                    )
+                    attempt_id = cur.lastrowid
+                    answer_rows.extend(
+                        (attempt_id, a.q_id, a.selected, a.time, a.confidence) for a in attempt.answers
+                    )
+                cur.executemany(
+                    "INSERT INTO answers (attempt_id, q_id, selected, time, confidence) VALUES (?, ?, ?, ?, ?)",
+                    answer_rows,
+                )
+        except Exception as e:
+            print(f"Writing attempts to {self.path} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        flush_seconds = time.perf_counter() - started
+        self.flushes += 1
+        self.records += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.flush_seconds += flush_seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, flush_seconds)
+        for _, future, _ in batch:
+            future.set_result(None)
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def history(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Attempt], Optional[str]]:
+        """
+        Returns a user's attempts, newest first, and the cursor for the next
+        page (None on the last page). Pages seek on (created_at, id) through
+        the (user_id, created_at, id) index, so every page costs the same.
+        """
+        conn = self._reader()
+        if cursor is None:
+            rows = conn.execute(
+                "SELECT id, user_id, topic, score, category, created_at FROM attempts"
+                " WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit + 1),
+            ).fetchall()
+        else:
+            created_at, attempt_id = decode_cursor(cursor)
+            rows = conn.execute(
+                "SELECT id, user_id, topic, score, category, created_at FROM attempts"
+                " WHERE user_id = ? AND (created_at, id) < (?, ?)"
+                " ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, created_at, attempt_id, limit + 1),
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][5], rows[-1][0])
+
+        answers = {row[0]: [] for row in rows}
+        if answers:
+            placeholders = ",".join("?" * len(answers))
+            for attempt_id, q_id, selected, time_taken, confidence in conn.execute(
+                f"SELECT attempt_id, q_id, selected, time, confidence FROM answers"
+                f" WHERE attempt_id IN ({placeholders}) ORDER BY rowid",
+                list(answers),
+            ):
+                answers[attempt_id].append(Answer(q_id=q_id, selected=selected, time=time_taken, confidence=confidence))
+
+        attempts = [
+            Attempt(
+                user_id=user,
+                topic=topic,
+                answers=answers[attempt_id],
+                score=score,
+                category=category,
+                created_at=datetime.fromisoformat(created_at),
+            )
+            for attempt_id, user, topic, score, category, created_at in rows
+        ]
+        return attempts, next_cursor
+
+    def stats(self) -> dict:
+        flushes = self.flushes or 1
+        return {
+            "flushes": self.flushes,
+            "records": self.records,
+            "pending": len(self._pending),
+            "avg_batch": round(self.records / flushes, 2),
+            "max_batch": self.max_batch_seen,
+            "avg_flush_ms": round(self.flush_seconds / flushes * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+        }
+
+    def close(self):
+        """
+        Commits anything still queued and stops the writer.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+attempt_store = AttemptStore()
@@ -1,22 +1,23 @@
-from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, Optional
 import secrets
+import orm
+from token_cache import TokenCache
+from revocation import revocations
+from signing_keys import keyring
 
 # Configuration
-SECRET_KEY = secrets.token_urlsafe(32) # In prod, load from env
+# Signing keys come from the shared keyring (signing_keys.py)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Verified payloads, so repeat requests with the same cookie skip jwt.decode
+token_cache = TokenCache()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -24,8 +25,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "access", "jti": secrets.token_urlsafe(16)})
+    key = keyring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key.secret, algorithm=ALGORITHM, headers={"kid": key.kid})
     return encoded_jwt
 
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -34,16 +36,68 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "refresh", "jti": secrets.token_urlsafe(16)})
+    key = keyring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key.secret, algorithm=ALGORITHM, headers={"kid": key.kid})
     return encoded_jwt
 
-def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+def verify_token(token: str) -> Optional[Mapping]:
+    """
+    Returns the token's payload (read-only) or None if it is invalid or
+    expired.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            key = keyring.verification_key(jwt.get_unverified_header(token).get("kid"))
+            if key is None:
+                return None
+            payload = jwt.decode(token, key.secret, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        payload = MappingProxyType(payload)
+        if "exp" in payload:
+            token_cache.put(token, payload, payload["exp"])
+    if revocations.is_revoked(payload.get("jti")):
         return None
+    return payload
+
+def revoke_token(token: str):
+    """
+    Makes a token invalid from now until it expires. Invalid tokens are
+    ignored.
+    """
+    payload = verify_token(token)
+    token_cache.discard(token)
+    if payload is not None and payload.get("jti") and "exp" in payload:
+        revocations.revoke(payload["jti"], payload["exp"])
 
 def generate_csrf_token():
     return secrets.token_hex(32)
+
+async def get_token_from_cookie(request: Request):
+    token = request.cookies.get("access_token")
+    if not token:
+        # Fallback to header for Swagger UI or other clients
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            return auth_header[7:]
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    
+    if token.startswith("Bearer "):
+        token = token[7:]
+    return token
+
+def get_current_user(token: str = Depends(get_token_from_cookie), db: Session = Depends(orm.get_db)) -> orm.User:
+    """
+    Dependency for the routers package: the caller's row in the SQL
+    database, bound to the request's session.
+    """
+    payload = verify_token(token)
+    if payload is None or payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return orm.get_or_create_user(db, payload["sub"])
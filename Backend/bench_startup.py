@@ -0,0 +1,72 @@
+"""
+Cold-start benchmark: times `import main` in fresh interpreters and exits
+non-zero if the median goes over budget. Run it from CI or before raising
+worker counts, e.g.
+
+    python bench_startup.py --runs 5 --budget 1.2
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Seconds; generous for the framework imports, tight enough to catch
+# hashing or file loading creeping back into import time
+DEFAULT_BUDGET = float(os.environ.get("STARTUP_BUDGET_SECONDS", "1.2"))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TIMER = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+def time_import() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", TIMER],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+def slowest_modules(limit: int) -> list:
+    # -X importtime writes "import time: self | cumulative | name" to stderr
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    project = {os.path.splitext(name)[0] for name in os.listdir(BACKEND_DIR) if name.endswith(".py")}
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:"):
+            continue
+        try:
+            self_us = int(parts[0].split(":")[1])
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        if name.split(".")[0] in project:
+            rows.append((self_us / 1e6, name))
+    return sorted(rows, reverse=True)[:limit]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fail if importing main is slower than a budget")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds")
+    args = arg_parser.parse_args()
+
+    timings = [time_import() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"import main: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s over {args.runs} runs (budget {args.budget:.3f}s)")
+    print("Slowest project modules (self time):")
+    for seconds, name in slowest_modules(5):
+        print(f"  {seconds:.3f}s  {name}")
+
+    if median > args.budget:
+        print("FAIL: import time is over budget")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,422 @@
+"""
+Bulk grading of quiz attempts with NumPy.
+
+Attempts come as CSV or NDJSON and are graded in chunks: each chunk becomes
+an answer matrix (attempts x questions, option index per cell, -1 when
+unanswered), which is compared with the topic's answer key in one array
+operation. The score formula and category thresholds are those of
+routers/quiz.py.
+
+CSV: a header row, then one attempt per row. Columns user_id, topic,
+time_taken, confidence and hints_used are optional; every other column is
+a question id ("3" or "q3") holding the chosen option. A numeric cell is an
+option index; anything else is graded like /api/submit grades "selected"
+(option text, or a letter label).
+
+NDJSON: one attempt per line, either as /quiz/submit takes it
+    {"user_id": "s1", "answers": {"3": 1}, "time_taken": 60, "confidence": 4, "hints_used": 0}
+or as /api/submit takes it
+    {"user_id": "s1", "topic": "Binary Trees", "answers": [{"q_id": 3, "selected": "B", "time": 5, "confidence": 4}]}
+An integer "selected" is an option index; a string is graded exactly as
+/api/submit grades it.
+
+Usage:
+    python bulk_grading.py attempts.csv [--format csv|ndjson] [--out results.ndjson]
+"""
+import argparse
+import csv
+import json
+import operator
+from json.encoder import encode_basestring_ascii
+import os
+import sys
+import time
+from itertools import chain, repeat
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from answer_key import AnswerKey, KeyEntry, matches
+
+# Attempts graded per array operation
+CHUNK_ROWS = 10000
+
+# Scoring formula from routers/quiz.py
+TIME_CAP = 60 * 5
+DIFFICULTY_SCORE = 0.5
+MAX_HINTS = 5
+
+UNANSWERED = -1
+WRONG = -2
+# Key value for a question the topic has no answer for
+NO_KEY = -3
+# Larger option indexes can't be anyone's answer; they grade as WRONG
+MAX_OPTION = int(np.iinfo(np.int16).max)
+
+META_COLUMNS = ("user_id", "topic", "time_taken", "confidence", "hints_used")
+
+class Chunk:
+    """
+    Column arrays for a run of attempts. answers[i, j] is the option chosen
+    in attempt i for question q_ids[j].
+    """
+
+    def __init__(self, start: int, user_ids: List[str], topics: List[Optional[str]], time_taken: np.ndarray, confidence: np.ndarray, hints_used: np.ndarray, q_ids: List[int], answers: np.ndarray):
+        self.start = start
+        self.user_ids = user_ids
+        self.topics = topics
+        self.time_taken = time_taken
+        self.confidence = confidence
+        self.hints_used = hints_used
+        self.q_ids = q_ids
+        self.answers = answers
+
+def _option_code(selected, entry: Optional[KeyEntry]) -> int:
+    # Only correctness matters, so a string answer becomes the correct index
+    # when the answer key accepts it and WRONG otherwise
+    if selected is None or selected == "":
+        return UNANSWERED
+    if isinstance(selected, bool) or not isinstance(selected, (int, str)):
+        raise ValueError(f"Invalid selected value {selected!r}")
+    if isinstance(selected, int):
+        return selected if 0 <= selected <= MAX_OPTION else WRONG
+    if entry is not None and matches(entry, selected):
+        return entry.correct_index
+    return WRONG
+
+def _csv_cell(cell: str):
+    # Numeric cells are option indexes
+    return int(cell) if cell.lstrip("-").isdigit() else cell
+
+def _option_codes(indexes: np.ndarray) -> np.ndarray:
+    # Out-of-range indexes would wrap in int16
+    wrong = (indexes < UNANSWERED) | (indexes > MAX_OPTION)
+    return np.where(wrong, WRONG, indexes).astype(np.int16)
+
+def _parse_q_id(name: str) -> Optional[int]:
+    name = name.strip()
+    if name[:1] in ("q", "Q"):
+        name = name[1:]
+    return int(name) if name.isdigit() else None
+
+def iter_csv_chunks(lines: Iterable[str], key: AnswerKey, chunk_rows: int = CHUNK_ROWS, start: int = 0) -> Iterator[Chunk]:
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [h.strip() for h in header]
+    meta = {name: header.index(name) for name in META_COLUMNS if name in header}
+    q_columns = [(i, _parse_q_id(name)) for i, name in enumerate(header) if name not in meta]
+    q_columns = [(i, q_id) for i, q_id in q_columns if q_id is not None]
+    q_ids = [q_id for _, q_id in q_columns]
+    q_index = [i for i, _ in q_columns]
+    width = len(header)
+
+    rows: List[List[str]] = []
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        rows.append(row)
+        if len(rows) >= chunk_rows:
+            yield _csv_chunk(start, rows, meta, q_ids, q_index, key)
+            start += len(rows)
+            rows = []
+    if rows:
+        yield _csv_chunk(start, rows, meta, q_ids, q_index, key)
+
+def _parse_column(cells: Sequence[str], dtype, default) -> np.ndarray:
+    # NumPy parses a sequence of numeric strings in C; empty cells need
+    # filling first
+    try:
+        return np.array(cells, dtype=dtype)
+    except ValueError:
+        return np.array([cell or default for cell in cells], dtype=dtype)
+
+def _csv_chunk(start: int, rows: List[List[str]], meta: Dict[str, int], q_ids: List[int], q_index: List[int], key: AnswerKey) -> Chunk:
+    n = len(rows)
+    columns = list(zip(*rows))
+    user_ids = list(columns[meta["user_id"]]) if "user_id" in meta else [""] * n
+    topics = [t or None for t in columns[meta["topic"]]] if "topic" in meta else [None] * n
+
+    def column(name: str, default: float) -> np.ndarray:
+        if name not in meta:
+            return np.full(n, default)
+        return _parse_column(columns[meta[name]], np.float64, default)
+
+    answers = np.empty((n, len(q_ids)), dtype=np.int16)
+    for j, i in enumerate(q_index):
+        try:
+            # Fast path: every cell is an option index or empty
+            answers[:, j] = _option_codes(_parse_column(columns[i], np.int64, UNANSWERED))
+        except (ValueError, OverflowError):
+            q_id = q_ids[j]
+            answers[:, j] = [_option_code(_csv_cell(cell), key.table(topic).get(q_id)) for cell, topic in zip(columns[i], topics)]
+
+    return Chunk(start, user_ids, topics, column("time_taken", 0.0), column("confidence", 3.0), column("hints_used", 0.0), q_ids, answers)
+
+def iter_ndjson_chunks(lines: Iterable[str], key: AnswerKey, chunk_rows: int = CHUNK_ROWS, start: int = 0) -> Iterator[Chunk]:
+    records: List[dict] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        records.append(json.loads(line))
+        if len(records) >= chunk_rows:
+            yield _ndjson_chunk(start, records, key)
+            start += len(records)
+            records = []
+    if records:
+        yield _ndjson_chunk(start, records, key)
+
+_get_q_id = operator.itemgetter("q_id")
+_get_selected = operator.methodcaller("get", "selected")
+_get_time = operator.methodcaller("get", "time", 0.0)
+_get_confidence = operator.methodcaller("get", "confidence", 3)
+
+def _check_records(start: int, records: List[dict]):
+    # Finds and reports the first malformed record; only run once the
+    # column-wise checks in _ndjson_chunk have found one
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"Row {start + i} is not a JSON object")
+        topic = record.get("topic")
+        if topic is not None and not isinstance(topic, str):
+            raise ValueError(f"Row {start + i}: topic must be a string")
+        answers = record.get("answers") or {}
+        if not isinstance(answers, dict) and (not isinstance(answers, list) or not all(isinstance(a, dict) and "q_id" in a for a in answers)):
+            raise ValueError(f"Row {start + i}: answers must be an object or a list of answers with q_id")
+
+def _field(records: Sequence[dict], name: str, default=None) -> list:
+    return list(map(operator.methodcaller("get", name, default), records))
+
+def _float_column(values: list) -> np.ndarray:
+    # Missing (None) values become NaN
+    return np.array(values, dtype=np.float64)
+
+def _ndjson_chunk(start: int, records: List[dict], key: AnswerKey) -> Chunk:
+    """
+    Builds a chunk column by column: each field is pulled out of every
+    record with a C-level getter and every answer cell is graded by lookup,
+    so no Python code runs per answer (JSON decoding is then most of the
+    cost).
+    """
+    n = len(records)
+    if not all(map(isinstance, records, repeat(dict))):
+        _check_records(start, records)
+    user_ids = list(map(str, _field(records, "user_id", "")))
+    topics = _field(records, "topic")
+    if not set(map(type, topics)) <= {str, type(None)}:
+        _check_records(start, records)
+    answers = [a or {} for a in _field(records, "answers")]
+    is_object = np.fromiter(map(isinstance, answers, repeat(dict)), dtype=bool, count=n)
+    object_rows = np.flatnonzero(is_object)
+    list_rows = np.flatnonzero(~is_object)
+    object_answers = [answers[i] for i in object_rows.tolist()]
+    list_answers = [answers[i] for i in list_rows.tolist()]
+
+    # /api/submit shape: a list of {"q_id", "selected", "time", "confidence"}
+    flat = list(chain.from_iterable(list_answers))
+    try:
+        if not all(map(isinstance, list_answers, repeat(list))):
+            raise TypeError
+        list_q_keys = list(map(_get_q_id, flat))
+    except (TypeError, KeyError):
+        _check_records(start, records)
+        raise
+    list_counts = np.fromiter(map(len, list_answers), dtype=np.int64, count=len(list_answers))
+    list_cell_rows = np.repeat(list_rows, list_counts)
+    # /quiz/submit shape: question id -> option index
+    object_counts = np.fromiter(map(len, object_answers), dtype=np.int64, count=len(object_answers))
+    object_cell_rows = np.repeat(object_rows, object_counts)
+
+    # Row totals win; otherwise /quiz/submit rows default to 0s and 3, and
+    # /api/submit rows sum the answers' times and average their confidence
+    time_taken = _float_column(_field(records, "time_taken"))
+    confidence = _float_column(_field(records, "confidence"))
+    hints_used = _float_column(_field(records, "hints_used", 0))
+    spent = np.bincount(list_cell_rows, weights=np.array(list(map(_get_time, flat)), dtype=np.float64), minlength=n)
+    sure_sums = np.bincount(list_cell_rows, weights=np.array(list(map(_get_confidence, flat)), dtype=np.float64), minlength=n)
+    sure_counts = np.bincount(list_cell_rows, minlength=n)
+    time_taken = np.where(np.isnan(time_taken), np.where(is_object, 0.0, spent), time_taken)
+    mean_sure = np.divide(sure_sums, sure_counts, out=np.full(n, 3.0), where=sure_counts > 0)
+    confidence = np.where(np.isnan(confidence), np.where(is_object, 3.0, mean_sure), confidence)
+
+    q_keys = list(chain.from_iterable(object_answers)) + list_q_keys
+    if not q_keys:
+        return Chunk(start, user_ids, topics, time_taken, confidence, hints_used, [], np.full((n, 0), UNANSWERED, dtype=np.int16))
+    selected = list(chain.from_iterable(map(dict.values, object_answers))) + list(map(_get_selected, flat))
+    rows = np.concatenate([object_cell_rows, list_cell_rows])
+
+    # Question ids ("3" in the object shape) -> matrix columns
+    try:
+        q_array = np.array(q_keys).astype(np.int64)
+    except (ValueError, OverflowError):
+        q_array = np.fromiter(map(int, q_keys), dtype=np.int64, count=len(q_keys))
+    q_ids, cols = np.unique(q_array, return_inverse=True)
+
+    # Each distinct (topic, question, selected) is graded once and the
+    # cells are filled by lookup
+    topic_names = list(dict.fromkeys(topics))
+    topic_index = {topic: t for t, topic in enumerate(topic_names)}
+    row_topics = np.fromiter(map(topic_index.__getitem__, topics), dtype=np.int64, count=n)[rows]
+    cell_keys = list(zip(row_topics.tolist(), q_array.tolist(), selected))
+    try:
+        distinct = dict.fromkeys(cell_keys)
+    except TypeError:
+        # A list or object; _option_code names it
+        for value in selected:
+            _option_code(value, None)
+        raise
+    tables = [key.table(topic) for topic in topic_names]
+    for cell_key in distinct:
+        t, q_id, value = cell_key
+        distinct[cell_key] = _option_code(value, tables[t].get(q_id))
+    codes = np.fromiter(map(distinct.__getitem__, cell_keys), dtype=np.int16, count=len(cell_keys))
+
+    answers_matrix = np.full((n, len(q_ids)), UNANSWERED, dtype=np.int16)
+    answers_matrix[rows, cols] = codes
+    return Chunk(start, user_ids, topics, time_taken, confidence, hints_used, q_ids.tolist(), answers_matrix)
+
+def grade_chunk(chunk: Chunk, key: AnswerKey, levels: Sequence[Tuple[str, float]]) -> dict:
+    """
+    Returns column arrays: correct, answered, accuracy, score, category.
+    """
+    n = len(chunk.user_ids)
+    correct = np.zeros(n, dtype=np.int32)
+    bank_size = np.zeros(n, dtype=np.int32)
+
+    topic_names = list(dict.fromkeys(chunk.topics))
+    topic_ids = np.fromiter((topic_names.index(t) for t in chunk.topics), dtype=np.int32, count=n) if len(topic_names) > 1 else np.zeros(n, dtype=np.int32)
+    for t, topic in enumerate(topic_names):
+        table = key.table(topic)
+        expected = np.array([table[q].correct_index if q in table else NO_KEY for q in chunk.q_ids], dtype=np.int16)
+        rows = slice(None) if len(topic_names) == 1 else topic_ids == t
+        correct[rows] = (chunk.answers[rows] == expected).sum(axis=1)
+        bank_size[rows] = len(table)
+
+    answered = (chunk.answers != UNANSWERED).sum(axis=1)
+    accuracy = np.divide(correct, bank_size, out=np.zeros(n), where=bank_size > 0)
+
+    time_component = np.maximum(0.0, 1 - chunk.time_taken / TIME_CAP)
+    confidence_component = (chunk.confidence - 1) / 4
+    hints_penalty = chunk.hints_used / MAX_HINTS
+    raw_score = 0.5 * accuracy + 0.15 * time_component + 0.15 * confidence_component + 0.15 * DIFFICULTY_SCORE - 0.1 * hints_penalty
+    score = np.clip(raw_score, 0.0, 1.0)
+
+    # Highest level whose threshold the score reaches, lowest level if none
+    ordered = sorted(levels, key=lambda level: level[1])
+    names = np.array([name for name, _ in ordered])
+    thresholds = np.array([min_score for _, min_score in ordered])
+    category = names[np.maximum(np.searchsorted(thresholds, score, side="right") - 1, 0)]
+
+    return {
+        "correct": correct,
+        "answered": answered,
+        "accuracy": accuracy,
+        "score": score,
+        "category": category,
+    }
+
+RESULT_LINE = '{"row":%d,"user_id":%s,"topic":%s,"correct":%d,"answered":%d,"accuracy":%r,"score":%r,"category":%s}\n'
+
+def format_results(chunk: Chunk, results: dict) -> bytes:
+    """
+    One NDJSON line per attempt. Lines are filled from a template rather
+    than json.dumps'd one dict at a time, which would cost more than the
+    grading itself.
+    """
+    quoted: Dict[Optional[str], str] = {}
+
+    def quote(value: Optional[str]) -> str:
+        text = quoted.get(value)
+        if text is None:
+            text = quoted[value] = json.dumps(value)
+        return text
+
+    columns = zip(
+        range(chunk.start, chunk.start + len(chunk.user_ids)),
+        map(encode_basestring_ascii, chunk.user_ids),
+        map(quote, chunk.topics),
+        results["correct"].tolist(),
+        results["answered"].tolist(),
+        np.round(results["accuracy"], 4).tolist(),
+        np.round(results["score"], 4).tolist(),
+        map(quote, results["category"].tolist()),
+    )
+    return "".join([RESULT_LINE % row for row in columns]).encode("utf-8")
+
+def iter_chunks(lines: Iterable[str], fmt: str, key: AnswerKey, chunk_rows: int = CHUNK_ROWS, start: int = 0) -> Iterator[Chunk]:
+    if fmt == "csv":
+        return iter_csv_chunks(lines, key, chunk_rows, start)
+    return iter_ndjson_chunks(lines, key, chunk_rows, start)
+
+def grade_lines(lines: List[str], fmt: str, key: AnswerKey, levels: Sequence[Tuple[str, float]], start: int = 0) -> Tuple[bytes, int]:
+    """
+    Grades a block of input lines (for CSV, the header first). Returns the
+    NDJSON results and the number of attempts graded.
+    """
+    out = []
+    graded = 0
+    for chunk in iter_chunks(lines, fmt, key, start=start):
+        out.append(format_results(chunk, grade_chunk(chunk, key, levels)))
+        graded += len(chunk.user_ids)
+    return b"".join(out), graded
+
+async def aiter_line_blocks(data: AsyncIterable[bytes], block_lines: int = CHUNK_ROWS) -> AsyncIterator[List[str]]:
+    """
+    Splits a byte stream (e.g. a request body) into blocks of lines.
+    """
+    pending = b""
+    block: List[str] = []
+    async for part in data:
+        pending += part
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        block.extend(line.decode("utf-8") for line in lines)
+        while len(block) >= block_lines:
+            yield block[:block_lines]
+            block = block[block_lines:]
+    if pending:
+        block.append(pending.decode("utf-8"))
+    if block:
+        yield block
+
+def load_default_banks(key: AnswerKey):
+    # The per-topic banks of /api/submit, and Data/questions.json (topic
+    # None) used by /quiz/submit
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    topics_file = os.path.join(backend_dir, "data_storage", "questions.json")
+    if os.path.exists(topics_file):
+        with open(topics_file, "r", encoding="utf-8") as f:
+            for topic, questions in json.load(f).items():
+                key.load_topic(topic, questions)
+    quiz_file = os.path.join(os.path.dirname(backend_dir), "Data", "questions.json")
+    if os.path.exists(quiz_file):
+        with open(quiz_file, "r", encoding="utf-8") as f:
+            key.load_topic(None, json.load(f))
+
+if __name__ == "__main__":
+    from orm import DEFAULT_LEVELS
+
+    arg_parser = argparse.ArgumentParser(description="Grade a file of quiz attempts")
+    arg_parser.add_argument("input", help="CSV or NDJSON file, - for stdin")
+    arg_parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    arg_parser.add_argument("--out", help="NDJSON results file (default: stdout)")
+    args = arg_parser.parse_args()
+
+    fmt = args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    key = AnswerKey()
+    load_default_banks(key)
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    dst = open(args.out, "wb") if args.out else sys.stdout.buffer
+    started = time.perf_counter()
+    graded = 0
+    with src, dst:
+        for chunk in iter_chunks(src, fmt, key):
+            dst.write(format_results(chunk, grade_chunk(chunk, key, DEFAULT_LEVELS)))
+            graded += len(chunk.user_ids)
+    elapsed = time.perf_counter() - started
+    print(f"Graded {graded} attempts in {elapsed:.2f}s ({graded / elapsed if elapsed else 0:.0f}/s)", file=sys.stderr)
@@ -0,0 +1,189 @@
+"""
+Ahead-of-time compiled content bundle.
+
+Packs every topic in Data/topics into one file that the backend can mmap
+instead of parsing Markdown:
+
+    magic        8 bytes   b"TFBUNDL1"
+    index_len    8 bytes   little-endian unsigned
+    index        index_len bytes of UTF-8 JSON
+    bodies       UTF-8 block bodies, back to back
+
+The index maps topic -> level -> block type -> [(title, offset, length)],
+plus the whole-file table per topic, with offsets relative to the start of
+the bodies. Identical bodies are stored once. The file is opened read-only,
+so any number of worker processes share the same pages, and bodies are
+sliced out of the map per lookup rather than decoded and kept.
+
+Usage:
+    python content_bundle.py [--data-dir DIR] [--out FILE]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from models import ContentBlock
+
+MAGIC = b"TFBUNDL1"
+BUNDLE_FORMAT = 2
+_HEADER = struct.Struct("<8sQ")
+
+DEFAULT_BUNDLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "content.bundle")
+
+def write_bundle(path: str, topics: Iterable[Tuple[str, object, object]]):
+    """
+    Writes a bundle from (topic, TopicEntry, CatalogEntry) triples.
+    The file is replaced atomically, so running workers keep their old map.
+    """
+    bodies = bytearray()
+    offsets: Dict[bytes, int] = {}
+
+    def add(block: ContentBlock) -> list:
+        data = block.body_md.encode("utf-8")
+        offset = offsets.get(data)
+        if offset is None:
+            offset = offsets[data] = len(bodies)
+            bodies.extend(data)
+        return [block.title, offset, len(data)]
+
+    def pack(table: Dict[str, List[ContentBlock]]) -> dict:
+        return {pref: [add(b) for b in blocks] for pref, blocks in table.items() if blocks}
+
+    index = {"format": BUNDLE_FORMAT, "topics": {}}
+    for topic, entry, catalog_entry in topics:
+        index["topics"][topic] = {
+            "catalog": catalog_entry._asdict(),
+            "levels": {level: pack(table) for level, table in entry.by_level.items()},
+            "closed_levels": sorted(entry.closed_levels),
+            "fallback": pack(entry.fallback),
+        }
+
+    index_bytes = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        f.write(bodies)
+    os.replace(tmp_path, path)
+
+class ContentBundle:
+    """
+    Read-only, memory-mapped view of a bundle file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        st = os.stat(path)
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a content bundle")
+        index = json.loads(self._mm[_HEADER.size:_HEADER.size + index_len])
+        if index.get("format") != BUNDLE_FORMAT:
+            self._mm.close()
+            raise ValueError(f"Unsupported content bundle format: {index.get('format')}")
+        self._topics: Dict[str, dict] = index["topics"]
+        self._bodies_start = _HEADER.size + index_len
+
+    def close(self):
+        self._mm.close()
+
+    def topics(self) -> List[str]:
+        return list(self._topics)
+
+    def catalog(self, topic: str) -> Optional[dict]:
+        packed = self._topics.get(topic)
+        return packed["catalog"] if packed else None
+
+    def _unpack(self, pref: str, refs: list) -> List[ContentBlock]:
+        start = self._bodies_start
+        return [
+            ContentBlock(type=pref, title=title, body_md=self._mm[start + offset:start + offset + length].decode("utf-8"))
+            for title, offset, length in refs
+        ]
+
+    def topic(self, topic: str, mtime_ns: int, size: int) -> Optional["BundleTopic"]:
+        packed = self._topics.get(topic)
+        return BundleTopic(self, packed, mtime_ns, size) if packed is not None else None
+
+class BundleTopic:
+    """
+    A topic in a bundle, with the same lookups as content_index.TopicEntry.
+    Holds only the bundle's (offset, length) refs; each lookup decodes the
+    blocks it returns and keeps nothing.
+    """
+
+    def __init__(self, bundle: ContentBundle, packed: dict, mtime_ns: int, size: int):
+        self._bundle = bundle
+        self._packed = packed
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.closed_levels: FrozenSet[str] = frozenset(packed["closed_levels"])
+
+    @property
+    def version(self) -> str:
+        return f"{self.mtime_ns}-{self.size}"
+
+    def _refs(self, section: Optional[str]) -> Dict[str, list]:
+        return self._packed["levels"][section] if section is not None else self._packed["fallback"]
+
+    def select(self, level: str, preferences: List[str]) -> Iterator[ContentBlock]:
+        level = level.lower()
+        table = self._refs(level if level in self.closed_levels else None)
+        for pref in preferences:
+            refs = table.get(pref)
+            if refs:
+                yield from self._bundle._unpack(pref, refs)
+
+    def blocks(self, level: str, preferences: List[str]) -> List[ContentBlock]:
+        return list(self.select(level, preferences))
+
+    def block(self, section: Optional[str], pref: str, position: int) -> ContentBlock:
+        return self._bundle._unpack(pref, [self._refs(section)[pref][position]])[0]
+
+    # Whole tables, decoded on every access: for indexing, not serving
+
+    @property
+    def by_level(self) -> Dict[str, Dict[str, List[ContentBlock]]]:
+        return {
+            level: {pref: self._bundle._unpack(pref, refs) for pref, refs in table.items()}
+            for level, table in self._packed["levels"].items()
+        }
+
+    @property
+    def fallback(self) -> Dict[str, List[ContentBlock]]:
+        return {pref: self._bundle._unpack(pref, refs) for pref, refs in self._packed["fallback"].items()}
+
+def compile_bundle(data_dir: str, out_path: str) -> int:
+    # Imported here: content_index imports this module to read bundles
+    from content_index import ContentIndex
+
+    index = ContentIndex(data_dir)
+    index.refresh()
+    topics = []
+    for topic in index.topics():
+        entry = index.get(topic)
+        catalog_entry = index.catalog_entry(topic)
+        if entry is not None and catalog_entry is not None:
+            topics.append((topic, entry, catalog_entry))
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    write_bundle(out_path, topics)
+    return len(topics)
+
+if __name__ == "__main__":
+    from content_index import TOPICS_DIR
+
+    arg_parser = argparse.ArgumentParser(description="Compile Data/topics into a content bundle")
+    arg_parser.add_argument("--data-dir", default=TOPICS_DIR)
+    arg_parser.add_argument("--out", default=DEFAULT_BUNDLE_FILE)
+    args = arg_parser.parse_args()
+
+    count = compile_bundle(args.data_dir, args.out)
+    print(f"Wrote {count} topics to {args.out} ({os.path.getsize(args.out)} bytes)")
@@ -0,0 +1,382 @@
+import itertools
+import json
+import os
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from models import ContentBlock
+from content_bundle import BundleTopic, ContentBundle
+from parser import read_frontmatter
+from utils import BLOCK_MAPPINGS, ScanEvent, iter_blocks
+
+TOPICS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data", "topics")
+MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "topics_manifest.json")
+MANIFEST_FORMAT = 1
+
+# Seconds between scans of the topics directory
+POLL_INTERVAL = 2.0
+
+# Block type -> blocks of that type, in document order
+BlockTable = Dict[str, List[ContentBlock]]
+
+class TopicEntry(NamedTuple):
+    mtime_ns: int
+    size: int
+    # level (lower-cased) -> block table, for every level section in the file
+    by_level: Dict[str, BlockTable]
+    # Levels whose section is closed by <!-- level:end -->. Only these are
+    # served per level; any other level gets the whole file.
+    closed_levels: FrozenSet[str]
+    # Blocks for the whole file
+    fallback: BlockTable
+
+    @property
+    def version(self) -> str:
+        return f"{self.mtime_ns}-{self.size}"
+
+    def select(self, level: str, preferences: List[str]) -> Iterator[ContentBlock]:
+        level = level.lower()
+        table = self.by_level[level] if level in self.closed_levels else self.fallback
+        for pref in preferences:
+            yield from table.get(pref, ())
+
+    def blocks(self, level: str, preferences: List[str]) -> List[ContentBlock]:
+        return list(self.select(level, preferences))
+
+    def block(self, section: Optional[str], pref: str, position: int) -> ContentBlock:
+        """
+        A block by its place in a level's table (section None: the whole-file
+        table).
+        """
+        table = self.by_level[section] if section is not None else self.fallback
+        return table[pref][position]
+
+def _block_table(tagged: BlockTable, fenced: BlockTable) -> BlockTable:
+    # Tagged code blocks take precedence over bare ```lang fences
+    table = dict(fenced)
+    table.update(tagged)
+    return table
+
+def compile_topic(events: Iterable[ScanEvent]) -> Tuple[Dict[str, BlockTable], FrozenSet[str], BlockTable]:
+    """
+    Sorts the blocks of one scan of a topic file into per-level tables.
+    Returns (tables by level, closed levels, whole-file table).
+    """
+    found: Dict[Optional[str], Tuple[BlockTable, BlockTable]] = {None: ({}, {})}
+    closed = set()
+    for event in events:
+        tagged, fenced = found.setdefault(event.section, ({}, {}))
+        if event.block is None:
+            closed.add(event.section)
+        else:
+            (fenced if event.fenced else tagged).setdefault(event.block.type, []).append(event.block)
+    fallback = _block_table(*found.pop(None))
+    by_level = {level: _block_table(*tables) for level, tables in found.items()}
+    return by_level, frozenset(closed), fallback
+
+class CatalogEntry(NamedTuple):
+    filename: str
+    topic: str
+    auth_required: bool
+    levels: Tuple[str, ...]
+    block_types: Tuple[str, ...]
+    mtime_ns: int
+    size: int
+
+    def public(self) -> dict:
+        return {
+            "filename": self.filename,
+            "topic": self.topic,
+            "auth_required": self.auth_required,
+            "levels": list(self.levels),
+            "block_types": list(self.block_types),
+        }
+
+class _Snapshot(NamedTuple):
+    # file stem -> parsed content, loaded lazily (never filled from a bundle)
+    topics: Dict[str, TopicEntry]
+    # file stem -> catalog entry, for every topic file
+    catalog: Dict[str, CatalogEntry]
+    # catalog as served by the topic list endpoints
+    listing: List[dict]
+
+def _load_topic(path: str, st: os.stat_result) -> Tuple[TopicEntry, CatalogEntry]:
+    filename = os.path.basename(path)
+    with open(path, "r", encoding="utf-8") as f:
+        frontmatter, consumed = read_frontmatter(f)
+        by_level, closed_levels, fallback = compile_topic(iter_blocks(itertools.chain(consumed, f)))
+    entry = TopicEntry(st.st_mtime_ns, st.st_size, by_level, closed_levels, fallback)
+    catalog_entry = CatalogEntry(
+        filename=filename,
+        topic=str(frontmatter.get("topic", filename[:-3])),
+        auth_required=bool(frontmatter.get("auth_required", False)),
+        levels=tuple(by_level),
+        block_types=tuple(pref for pref in BLOCK_MAPPINGS if fallback.get(pref)),
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+    )
+    return entry, catalog_entry
+
+class ContentIndex:
+    """
+    In-memory index and catalog of the topic files in data_dir.
+
+    Each file is parsed once into (level, block type) -> blocks and served by
+    lookup afterwards. refresh() re-parses only the files whose mtime or size
+    changed and swaps the result in as a new snapshot, so readers always see
+    either the old or the new index, never a half-built one.
+
+    The catalog (name, auth_required, levels, block types per topic) is saved
+    to manifest_path, so after a restart unchanged files are only stat'ed and
+    their content is parsed on first request.
+
+    If bundle_path is set, topics are served from that precompiled bundle
+    (see content_bundle.py) instead of data_dir, and refresh() re-opens the
+    bundle when it is replaced. Bundle topics are not cached: their blocks
+    are sliced from the shared map per lookup.
+    """
+
+    def __init__(self, data_dir: str, manifest_path: Optional[str] = None, bundle_path: Optional[str] = None):
+        self.data_dir = data_dir
+        self.manifest_path = manifest_path
+        self.bundle_path = bundle_path
+        self._bundle: Optional[ContentBundle] = None
+        # Replaced wholesale, never mutated in place
+        self._snapshot = _Snapshot({}, {}, [])
+        self._manifest_loaded = False
+        self._swap_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _path(self, topic: str) -> Optional[str]:
+        # Only files directly in data_dir, as refresh() scans; "../" or
+        # absolute names resolve elsewhere
+        data_dir = os.path.realpath(self.data_dir)
+        path = os.path.realpath(os.path.join(data_dir, f"{topic}.md"))
+        return path if os.path.dirname(path) == data_dir else None
+
+    def _cache(self, topic: str, entry: TopicEntry):
+        # Only topics the catalog already lists; the catalog itself is only
+        # changed by refresh()
+        with self._swap_lock:
+            if topic not in self._snapshot.catalog or topic in self._snapshot.topics:
+                return
+            topics = dict(self._snapshot.topics)
+            topics[topic] = entry
+            self._snapshot = self._snapshot._replace(topics=topics)
+
+    def _swap(self, changed: Optional[Dict[str, Tuple[TopicEntry, CatalogEntry]]] = None, removed: Iterable[str] = (), catalog: Optional[Dict[str, CatalogEntry]] = None):
+        with self._swap_lock:
+            topics = dict(self._snapshot.topics)
+            new_catalog = dict(self._snapshot.catalog)
+            new_catalog.update(catalog or {})
+            for topic, (entry, catalog_entry) in (changed or {}).items():
+                topics[topic] = entry
+                new_catalog[topic] = catalog_entry
+            for topic in removed:
+                topics.pop(topic, None)
+                new_catalog.pop(topic, None)
+            listing = [new_catalog[topic].public() for topic in sorted(new_catalog)]
+            self._snapshot = _Snapshot(topics, new_catalog, listing)
+
+    def _load_manifest(self) -> Dict[str, CatalogEntry]:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != MANIFEST_FORMAT:
+                return {}
+            return {
+                topic: CatalogEntry(**dict(fields, levels=tuple(fields["levels"]), block_types=tuple(fields["block_types"])))
+                for topic, fields in manifest["topics"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring topic manifest: {e}")
+            return {}
+
+    def _save_manifest(self):
+        if not self.manifest_path:
+            return
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "topics": {topic: entry._asdict() for topic, entry in self._snapshot.catalog.items()},
+        }
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def refresh(self) -> Tuple[List[str], List[str]]:
+        """
+        Re-indexes added and changed topic files and drops deleted ones.
+        Returns the (changed, removed) topic names.
+        """
+        if self.bundle_path:
+            return self._refresh_bundle()
+
+        with self._refresh_lock:
+            if not self._manifest_loaded:
+                self._manifest_loaded = True
+                manifest = self._load_manifest()
+                if manifest:
+                    self._swap(catalog=manifest)
+
+            current = self._snapshot.catalog
+            on_disk = {}
+            if os.path.isdir(self.data_dir):
+                with os.scandir(self.data_dir) as it:
+                    for dir_entry in it:
+                        if dir_entry.name.endswith(".md") and dir_entry.is_file():
+                            on_disk[dir_entry.name[:-3]] = dir_entry
+
+            changed = {}
+            for topic, dir_entry in on_disk.items():
+                try:
+                    st = dir_entry.stat()
+                    entry = current.get(topic)
+                    if entry is None or entry.mtime_ns != st.st_mtime_ns or entry.size != st.st_size:
+                        # Parsed outside the swap lock so readers are never held up
+                        changed[topic] = _load_topic(dir_entry.path, st)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Error indexing topic '{topic}': {e}")
+
+            removed = [topic for topic in current if topic not in on_disk]
+            if changed or removed:
+                self._swap(changed, removed)
+                try:
+                    self._save_manifest()
+                except OSError as e:
+                    print(f"Error saving topic manifest: {e}")
+            return sorted(changed), removed
+
+    def _refresh_bundle(self) -> Tuple[List[str], List[str]]:
+        with self._refresh_lock:
+            st = os.stat(self.bundle_path)
+            old = self._bundle
+            if old is not None and old.mtime_ns == st.st_mtime_ns and old.size == st.st_size:
+                return [], []
+
+            bundle = ContentBundle(self.bundle_path)
+            catalog = {}
+            for topic in bundle.topics():
+                fields = bundle.catalog(topic)
+                catalog[topic] = CatalogEntry(**dict(fields, levels=tuple(fields["levels"]), block_types=tuple(fields["block_types"])))
+            with self._swap_lock:
+                # Topic content is sliced out of the new bundle on demand
+                self._bundle = bundle
+                listing = [catalog[topic].public() for topic in sorted(catalog)]
+                self._snapshot = _Snapshot({}, catalog, listing)
+            # The old map is left for the garbage collector, as requests
+            # already in flight may still be reading from it
+            removed = [topic for topic in (old.topics() if old else []) if topic not in catalog]
+            return sorted(catalog), removed
+
+    def _get_from_bundle(self, topic: str) -> Optional[BundleTopic]:
+        bundle = self._bundle
+        catalog_entry = self._snapshot.catalog.get(topic)
+        if bundle is None or catalog_entry is None:
+            return None
+        return bundle.topic(topic, catalog_entry.mtime_ns, catalog_entry.size)
+
+    def get(self, topic: str) -> Union[TopicEntry, BundleTopic, None]:
+        entry = self._snapshot.topics.get(topic)
+        if entry is not None:
+            return entry
+
+        if self.bundle_path:
+            return self._get_from_bundle(topic)
+
+        # Not parsed yet: listed in the manifest, or uploaded since the last
+        # refresh (served, but not cached until refresh() lists it)
+        path = self._path(topic)
+        if path is None:
+            return None
+        try:
+            entry = _load_topic(path, os.stat(path))[0]
+        except (OSError, UnicodeDecodeError):
+            return None
+        self._cache(topic, entry)
+        return entry
+
+    def peek(self, topic: str) -> Union[TopicEntry, BundleTopic, None]:
+        """
+        Like get(), but a topic that isn't parsed yet is read without being
+        cached, for one-off passes over every topic (e.g. search indexing).
+        """
+        entry = self._snapshot.topics.get(topic)
+        if entry is not None:
+            return entry
+        if self.bundle_path:
+            return self._get_from_bundle(topic)
+        path = self._path(topic)
+        if path is None:
+            return None
+        try:
+            return _load_topic(path, os.stat(path))[0]
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def topics(self) -> List[str]:
+        return sorted(self._snapshot.catalog)
+
+    def catalog_entry(self, topic: str) -> Optional[CatalogEntry]:
+        return self._snapshot.catalog.get(topic)
+
+    def list_topics(self) -> List[dict]:
+        """
+        Returns the topic catalog. Built when the index changes, so this is a
+        plain attribute read.
+        """
+        return self._snapshot.listing
+
+class TopicWatcher:
+    """
+    Background thread that polls the index's data_dir and refreshes the index
+    when topic files are added, changed or deleted. Listeners are called
+    after every poll (and once right away) to sync anything derived from the
+    index.
+    """
+
+    def __init__(self, index: ContentIndex, interval: float = POLL_INTERVAL):
+        self.index = index
+        self.interval = interval
+        self.listeners: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="topic-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self):
+        try:
+            changed, removed = self.index.refresh()
+            if changed or removed:
+                print(f"Reindexed topics: changed={changed} removed={removed}")
+        except Exception as e:
+            print(f"Topic watcher error: {e}")
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Topic watcher listener error: {e}")
+
+    def _run(self):
+        self._poll()
+        while not self._stop.wait(self.interval):
+            self._poll()
+
+# Shared by main and the routers. Set CONTENT_BUNDLE to serve from a bundle
+# built with content_bundle.py instead of parsing Data/topics.
+content_index = ContentIndex(TOPICS_DIR, MANIFEST_FILE, bundle_path=os.environ.get("CONTENT_BUNDLE"))
+topic_watcher = TopicWatcher(content_index)
@@ -1,75 +1,117 @@
 import json
 import os
-from typing import Dict, List
-from models import UserInDB, Question
-from auth import get_password_hash
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from models import Principal, UserInDB, UserRecord, Question
+from utils import make_etag
+from answer_key import answer_key
+from user_store import LogStore
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data_storage")
-os.makedirs(DATA_DIR, exist_ok=True)
 
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+# Signups are appended here and folded into USERS_FILE in the background
+USERS_LOG_FILE = os.path.join(DATA_DIR, "users.log")
 QUESTIONS_FILE = os.path.join(DATA_DIR, "questions.json")
+QUESTIONS_LOG_FILE = os.path.join(DATA_DIR, "questions.log")
+
+# topic -> ETag of its question list, computed on first request for
+# topics in the bank
+questions_etags: Dict[str, str] = {}
 
 # Initial Mock Data
+# Hashes are precomputed (argon2 of "password123" and "admin123") so that
+# importing this module stays cheap
 INITIAL_USERS = {
     "demo_user": {
         "username": "demo_user",
-        "hashed_password": get_password_hash("password123"),
+        "hashed_password": "$argon2id$v=19$m=65536,t=3,p=4$vDcmhBAiRIgRwphzjpEyBg$l2HpXF5qot7hBdCFCRguu+8fe352moHyjFdFp76r778",
         "role": "user"
     },
     "admin": {
         "username": "admin",
-        "hashed_password": get_password_hash("admin123"),
+        "hashed_password": "$argon2id$v=19$m=65536,t=3,p=4$dw4hhLBWai1lDMG4l1JKKQ$4PLKg7vGgSj/n8Ei+EGRbhWHTEXiPAvl3ygowa4qrSQ",
         "role": "admin"
     }
 }
 
 INITIAL_QUESTIONS = {
     "Binary Trees": [
-        {"id": 1, "text": "What is the maximum number of nodes at level 'l' in a binary tree?", "options": ["2^l", "2^(l-1)", "2^(l+1)", "2l"]},
-        {"id": 2, "text": "What is the time complexity of searching in a BST (average case)?", "options": ["O(n)", "O(log n)", "O(n log n)", "O(1)"]},
-        {"id": 3, "text": "Which traversal visits the root first?", "options": ["Inorder", "Preorder", "Postorder", "Level Order"]},
-        {"id": 4, "text": "A binary tree with n nodes has how many edges?", "options": ["n", "n-1", "n+1", "2n"]},
-        {"id": 5, "text": "In a full binary tree, every node has how many children?", "options": ["0 or 2", "1 or 2", "0 or 1", "Exactly 2"]}
+        {"id": 1, "text": "What is the maximum number of nodes at level 'l' in a binary tree?", "options": ["2^l", "2^(l-1)", "2^(l+1)", "2l"], "correct_index": 0},
+        {"id": 2, "text": "What is the time complexity of searching in a BST (average case)?", "options": ["O(n)", "O(log n)", "O(n log n)", "O(1)"], "correct_index": 1},
+        {"id": 3, "text": "Which traversal visits the root first?", "options": ["Inorder", "Preorder", "Postorder", "Level Order"], "correct_index": 1},
+        {"id": 4, "text": "A binary tree with n nodes has how many edges?", "options": ["n", "n-1", "n+1", "2n"], "correct_index": 1},
+        {"id": 5, "text": "In a full binary tree, every node has how many children?", "options": ["0 or 2", "1 or 2", "0 or 1", "Exactly 2"], "correct_index": 0}
     ]
 }
 
-def load_users() -> Dict[str, dict]:
-    if not os.path.exists(USERS_FILE):
-        save_users(INITIAL_USERS)
-        return INITIAL_USERS
-    with open(USERS_FILE, "r") as f:
-        return json.load(f)
+# Mutations update the in-memory dicts below right away and are written
+# behind by each store's flusher thread, many per fsync. Await the returned
+# Future (asyncio.wrap_future) before acknowledging the change.
+users_store = LogStore(USERS_FILE, USERS_LOG_FILE)
+questions_store = LogStore(QUESTIONS_FILE, QUESTIONS_LOG_FILE)
 
-def save_users(users: Dict[str, dict]):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+def load_users() -> Dict[str, UserRecord]:
+    return {username: UserRecord.from_dict(data) for username, data in users_store.load(INITIAL_USERS).items()}
 
 def load_questions() -> Dict[str, List[dict]]:
-    if not os.path.exists(QUESTIONS_FILE):
-        save_questions(INITIAL_QUESTIONS)
-        return INITIAL_QUESTIONS
-    with open(QUESTIONS_FILE, "r") as f:
-        return json.load(f)
-
-def save_questions(questions: Dict[str, List[dict]]):
-    with open(QUESTIONS_FILE, "w") as f:
-        json.dump(questions, f, indent=4)
-
-# In-memory cache
-users_db = load_users()
-questions_db = load_questions()
-
-def get_user(username: str) -> UserInDB:
-    user_data = users_db.get(username)
-    if user_data:
-        return UserInDB(**user_data)
-    return None
-
-def create_user(user: UserInDB):
-    users_db[user.username] = user.dict()
-    save_users(users_db)
+    return questions_store.load(INITIAL_QUESTIONS)
+
+# In-memory cache, filled by init_storage() from the app's lifespan
+users_db: Dict[str, UserRecord] = {}
+questions_db: Dict[str, List[dict]] = {}
+
+def init_storage():
+    """
+    Loads users and questions from disk. Called once at startup rather than
+    at import, so importing this module does no I/O.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    users_db.clear()
+    users_db.update(load_users())
+    questions_db.clear()
+    questions_db.update(load_questions())
+    questions_etags.clear()
+    for topic, questions in questions_db.items():
+        answer_key.load_topic(topic, questions)
+
+def close_storage():
+    # Flushes any queued mutations
+    users_store.close()
+    questions_store.close()
+
+def get_user(username: str) -> Optional[UserRecord]:
+    return users_db.get(username)
+
+def get_principal(username: str) -> Optional[Principal]:
+    record = users_db.get(username)
+    return record.principal if record is not None else None
+
+def create_user(user: UserInDB) -> Future:
+    record = UserRecord(user.username, user.hashed_password, user.role)
+    users_db[user.username] = record
+    return users_store.put(user.username, record.to_dict())
+
+def save_questions(topic: str, questions: List[dict]) -> Future:
+    questions_db[topic] = questions
+    questions_etags.pop(topic, None)
+    answer_key.load_topic(topic, questions)
+    return questions_store.put(topic, questions)
 
 def get_questions_by_topic(topic: str) -> List[Question]:
     qs = questions_db.get(topic, [])
     return [Question(**q) for q in qs]
+
+def get_questions_etag(topic: str) -> Optional[str]:
+    """
+    The ETag of a topic's question list, or None if the bank has no
+    questions for it (nothing is cached for unknown topics).
+    """
+    etag = questions_etags.get(topic)
+    if etag is None:
+        questions = questions_db.get(topic)
+        if not questions:
+            return None
+        etag = make_etag("questions", topic, json.dumps(questions, sort_keys=True))
+        questions_etags[topic] = etag
+    return etag
@@ -0,0 +1,318 @@
+"""
+Running per-question statistics for admins.
+
+Every graded attempt updates, for each question it answered: the share of
+correct answers (p-value), how often each option was chosen, mean and
+spread of time and confidence (Welford), and the point-biserial correlation
+between getting the question right and the rest of the attempt's score
+(discrimination). Each question holds a fixed handful of numbers, plus at
+most MAX_OPTIONS option counters, however many attempts it has seen.
+
+All of these are moments, and moments from separate processes combine
+exactly (Chan et al.), so each worker keeps only what it has seen since its
+last checkpoint. Every checkpoint_interval seconds (and on close) it merges
+that into the shared checkpoint file under a file lock and starts over;
+totals() is the file plus the unsaved part.
+"""
+import json
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from answer_key import answer_key
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; concurrent checkpoints there may lose updates
+    fcntl = None
+
+CHECKPOINT_FILE = os.environ.get(
+    "ITEM_STATS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "item_stats.json"),
+)
+
+# Distinct options counted per question; any beyond go under OTHER_OPTION
+MAX_OPTIONS = 16
+OTHER_OPTION = "(other)"
+
+class Moments:
+    """
+    Count, mean and sum of squared deviations of one variable.
+    """
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other: "Moments"):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    def sd(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    def to_list(self) -> list:
+        return [self.n, self.mean, self.m2]
+
+class CoMoments:
+    """
+    Joint moments of two variables, for their correlation.
+    """
+    __slots__ = ("n", "mean_x", "mean_y", "m2x", "m2y", "cxy")
+
+    def __init__(self, n: int = 0, mean_x: float = 0.0, mean_y: float = 0.0, m2x: float = 0.0, m2y: float = 0.0, cxy: float = 0.0):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2x = m2x
+        self.m2y = m2y
+        self.cxy = cxy
+
+    def add(self, x: float, y: float):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.m2x += dx * (x - self.mean_x)
+        self.m2y += dy * (y - self.mean_y)
+        self.cxy += dx * (y - self.mean_y)
+
+    def merge(self, other: "CoMoments"):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.m2x += other.m2x + dx * dx * weight
+        self.m2y += other.m2y + dy * dy * weight
+        self.cxy += other.cxy + dx * dy * weight
+        self.n = n
+
+    def correlation(self) -> Optional[float]:
+        if self.m2x <= 0 or self.m2y <= 0:
+            return None
+        return self.cxy / math.sqrt(self.m2x * self.m2y)
+
+    def to_list(self) -> list:
+        return [self.n, self.mean_x, self.mean_y, self.m2x, self.m2y, self.cxy]
+
+class ItemStats:
+    __slots__ = ("responses", "correct", "options", "time", "confidence", "discrimination")
+
+    def __init__(self):
+        self.responses = 0
+        self.correct = 0
+        self.options: Dict[str, int] = {}
+        self.time = Moments()
+        self.confidence = Moments()
+        # Correct (0/1) against the attempt's score on its other questions
+        self.discrimination = CoMoments()
+
+    def _count_option(self, option: str, count: int):
+        if option not in self.options and len(self.options) >= MAX_OPTIONS:
+            option = OTHER_OPTION
+        self.options[option] = self.options.get(option, 0) + count
+
+    def add(self, selected: str, spent: float, confidence: float, correct: bool, rest_score: Optional[float]):
+        self.responses += 1
+        self.correct += correct
+        self._count_option(str(selected), 1)
+        self.time.add(spent)
+        self.confidence.add(confidence)
+        if rest_score is not None:
+            self.discrimination.add(float(correct), rest_score)
+
+    def merge(self, other: "ItemStats"):
+        self.responses += other.responses
+        self.correct += other.correct
+        for option, count in other.options.items():
+            self._count_option(option, count)
+        self.time.merge(other.time)
+        self.confidence.merge(other.confidence)
+        self.discrimination.merge(other.discrimination)
+
+    def to_dict(self) -> dict:
+        return {
+            "responses": self.responses,
+            "correct": self.correct,
+            "options": self.options,
+            "time": self.time.to_list(),
+            "confidence": self.confidence.to_list(),
+            "discrimination": self.discrimination.to_list(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ItemStats":
+        stats = cls()
+        stats.responses = data["responses"]
+        stats.correct = data["correct"]
+        stats.options = dict(data["options"])
+        stats.time = Moments(*data["time"])
+        stats.confidence = Moments(*data["confidence"])
+        stats.discrimination = CoMoments(*data["discrimination"])
+        return stats
+
+    def summary(self) -> dict:
+        def rounded(x: Optional[float]) -> Optional[float]:
+            return round(x, 4) if x is not None else None
+
+        return {
+            "responses": self.responses,
+            "p_value": rounded(self.correct / self.responses) if self.responses else None,
+            "options": {option: round(count / self.responses, 4) for option, count in self.options.items()} if self.responses else {},
+            "mean_time": rounded(self.time.mean) if self.time.n else None,
+            "sd_time": rounded(self.time.sd()),
+            "mean_confidence": rounded(self.confidence.mean) if self.confidence.n else None,
+            "sd_confidence": rounded(self.confidence.sd()),
+            "discrimination": rounded(self.discrimination.correlation()),
+        }
+
+# (topic, question id)
+ItemKey = Tuple[str, int]
+
+# One graded answer: (question id, selected, time, confidence, correct)
+GradedAnswer = Tuple[int, str, float, float, bool]
+
+def read_checkpoint(path: str) -> Dict[ItemKey, ItemStats]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(item["topic"], item["q_id"]): ItemStats.from_dict(item["stats"]) for item in data.get("items", [])}
+
+def merge_into(totals: Dict[ItemKey, ItemStats], part: Dict[ItemKey, ItemStats]):
+    for key, stats in part.items():
+        target = totals.get(key)
+        if target is None:
+            target = totals[key] = ItemStats()
+        target.merge(stats)
+
+class ItemStatsStore:
+    def __init__(self, checkpoint_path: Optional[str] = CHECKPOINT_FILE, checkpoint_interval: float = 30.0):
+        self.checkpoint_path = checkpoint_path or None
+        self.checkpoint_interval = checkpoint_interval
+        # Seen since the last checkpoint
+        self._pending: Dict[ItemKey, ItemStats] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checkpointer: Optional[threading.Thread] = None
+        self.attempts = 0
+        self.checkpoints = 0
+
+    def open(self):
+        if self.checkpoint_path:
+            self._stop.clear()
+            self._checkpointer = threading.Thread(target=self._run_checkpointer, name="item-stats-checkpoint", daemon=True)
+            self._checkpointer.start()
+
+    def close(self):
+        if self._checkpointer is not None:
+            self._stop.set()
+            self._checkpointer.join()
+            self._checkpointer = None
+        if self.checkpoint_path:
+            self.checkpoint()
+
+    def record_attempt(self, topic: str, answers: Sequence[GradedAnswer]):
+        """
+        Adds one graded attempt. O(answers).
+
+        Only questions in the topic's answer key are counted, so clients
+        can't grow the table with made-up topics or ids, and a question
+        answered more than once counts once, with its last answer.
+        """
+        latest: Dict[int, GradedAnswer] = {}
+        for answer in answers:
+            if answer_key.lookup(topic, answer[0]) is not None:
+                latest[answer[0]] = answer
+        if not latest:
+            return
+        answered = len(latest)
+        total_correct = sum(1 for answer in latest.values() if answer[4])
+        with self._lock:
+            for q_id, selected, spent, confidence, correct in latest.values():
+                stats = self._pending.get((topic, q_id))
+                if stats is None:
+                    stats = self._pending[(topic, q_id)] = ItemStats()
+                rest_score = (total_correct - correct) / (answered - 1) if answered > 1 else None
+                stats.add(selected, spent, confidence, correct, rest_score)
+            self.attempts += 1
+
+    def checkpoint(self):
+        """
+        Merges what this process has seen into the checkpoint file.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        try:
+            with open(f"{self.checkpoint_path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                totals = read_checkpoint(self.checkpoint_path)
+                merge_into(totals, pending)
+                data = {"items": [{"topic": topic, "q_id": q_id, "stats": stats.to_dict()} for (topic, q_id), stats in totals.items()]}
+                tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.checkpoint_path)
+        except (OSError, ValueError):
+            # Keep the updates for the next try
+            with self._lock:
+                merge_into(pending, self._pending)
+                self._pending = pending
+            raise
+        self.checkpoints += 1
+
+    def _run_checkpointer(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+            except (OSError, ValueError) as e:
+                print(f"Item stats checkpoint failed: {e}")
+
+    def totals(self) -> Dict[ItemKey, ItemStats]:
+        """
+        Statistics over every process's checkpointed attempts plus this
+        process's unsaved ones. O(items).
+        """
+        totals = read_checkpoint(self.checkpoint_path) if self.checkpoint_path else {}
+        with self._lock:
+            merge_into(totals, self._pending)
+        return totals
+
+    def report(self, topic: Optional[str] = None) -> Dict[str, List[dict]]:
+        report: Dict[str, List[dict]] = {}
+        for (item_topic, q_id), stats in sorted(self.totals().items()):
+            if topic is None or item_topic == topic:
+                report.setdefault(item_topic, []).append({"q_id": q_id, **stats.summary()})
+        return report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"attempts": self.attempts, "pending_items": len(self._pending), "checkpoints": self.checkpoints}
+
+item_stats = ItemStatsStore()
@@ -1,29 +1,68 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Response, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Response, Request, Header, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from typing import List, Optional
-from models import Attempt, ContentRequest, ContentResponse, QuizResult, Question, User, UserInDB, Token, TokenData, UserSignup
-from utils import parse_markdown_content, calculate_score, determine_category
-from auth import verify_password, get_password_hash, create_access_token, create_refresh_token, verify_token, generate_csrf_token
-from database import get_user, create_user, get_questions_by_topic, users_db # users_db needed for direct check in login
+from models import AdaptiveAnswer, AdaptiveStart, AdaptiveState, Answer, Attempt, AttemptPage, ContentRequest, ContentResponse, Principal, QuizResult, QuizSessionStart, QuizSessionState, Question, SearchHit, User, UserInDB, Token, TokenData, UserSignup
+from utils import determine_category, grade_answers, etag_matches, make_etag, normalize_preferences
+from auth import create_access_token, create_refresh_token, verify_token, revoke_token, generate_csrf_token, get_token_from_cookie, token_cache
+from database import get_user, get_principal, create_user, get_questions_by_topic, get_questions_etag, init_storage, close_storage, users_db, users_store, questions_db, questions_store # users_db needed for direct check in login
+from content_index import content_index, topic_watcher
+from response_cache import CachedBody, ResponseCache
+from search_index import search_index
+from attempt_store import attempt_store
+from password_pool import PoolSaturated, password_pool
+from revocation import revocations
+from rate_limit import MemoryBackend, RateLimitMiddleware, RATE_LIMITS
+from routers import content, quiz
+from answer_key import answer_key
+from adaptive import adaptive_engine
+from quiz_sessions import QuizSession, quiz_sessions
+from item_stats import item_stats
+from bulk_grading import aiter_line_blocks, grade_lines
+from starlette.concurrency import run_in_threadpool
+import orm
 import os
-from datetime import timedelta
+import json
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # All disk loading happens here rather than at import, so a worker
+    # imports quickly and only then pays for its data
+    init_storage()
+    attempt_store.open()
+    quiz_sessions.open()
+    item_stats.open()
+    orm.init_db()
+    content_index.refresh()
+    # The search index is built and kept in sync from the watcher thread
+    topic_watcher.listeners.append(functools.partial(search_index.sync, content_index))
+    topic_watcher.start()
+    password_pool.start()
+    yield
+    password_pool.shutdown()
+    topic_watcher.stop()
+    topic_watcher.listeners.clear()
+    close_storage()
+    quiz_sessions.close()
+    item_stats.close()
+    attempt_store.close()
+    orm.engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Throttles /api/login and /api/signup per client IP and per username
+rate_limit_backend = MemoryBackend()
+app.add_middleware(RateLimitMiddleware, limits=RATE_LIMITS, backend=rate_limit_backend)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_token_from_cookie(request: Request):
-    token = request.cookies.get("access_token")
-    if not token:
-        # Fallback to header for Swagger UI or other clients
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            return auth_header.split(" ")[1]
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    if token.startswith("Bearer "):
-        token = token.split(" ")[1]
-    return token
+# SQLAlchemy-backed routes, used by the Streamlit frontend
+app.include_router(quiz.router, prefix="/quiz", tags=["quiz"])
+app.include_router(content.router, prefix="/content", tags=["content"])
 
 async def get_current_user(token: str = Depends(get_token_from_cookie)):
     payload = verify_token(token)
@@ -37,30 +76,53 @@ async def get_current_user(token: str = Depends(get_token_from_cookie)):
     if username is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
     
-    user = get_user(username)
+    # Cached per user; no model is built on this path
+    user = get_principal(username)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
+    return current_user
+
+async def get_current_admin_user(current_user: Principal = Depends(get_current_active_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return current_user
 
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Data", "topics")
+# Parsed topic files (content_index) are kept current by a background watcher
+# Ready-to-send /api/content bodies
+content_cache = ResponseCache()
+
+def password_pool_busy() -> HTTPException:
+    # Argon2 is at capacity; shed the request instead of queueing it
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
 
 @app.post("/api/signup", response_model=Token)
 async def signup(user: UserSignup, response: Response):
     if get_user(user.username):
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    # Hash password
-    hashed_password = get_password_hash(user.password)
+    # Hash password (in the password pool, off the event loop)
+    try:
+        hashed_password = await password_pool.hash(user.password)
+    except PoolSaturated:
+        raise password_pool_busy()
+    # Another signup for the name may have finished while this one hashed
+    if get_user(user.username):
+        raise HTTPException(status_code=400, detail="Username already registered")
     
     user_obj = UserInDB(
         username=user.username,
         hashed_password=hashed_password,
         role="user"
     )
-    create_user(user_obj)
+    # Respond only once the signup is durable
+    await asyncio.wrap_future(create_user(user_obj))
     
     # Auto-login
     access_token_expires = timedelta(minutes=15)
@@ -87,6 +149,19 @@ async def login_for_access_token(response: Response, form_data: OAuth2PasswordRe
     if not user:
         print("User not found")
         raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        password_ok = await password_pool.verify(form_data.password, user.hashed_password)
+    except PoolSaturated:
+        raise password_pool_busy()
+    if not password_ok:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
         )
     print("Login successful")
     
@@ -141,11 +216,11 @@ async def refresh_token(request: Request, response: Response):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
     
     username = payload.get("sub")
-    user_dict = users_db.get(username)
-    if not user_dict:
+    if username not in users_db:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
         
-    # Rotate tokens
+    # Rotate tokens; the old refresh token can't be used again
+    revoke_token(refresh_token)
     access_token = create_access_token(data={"sub": username})
     new_refresh_token = create_refresh_token(data={"sub": username})
     
@@ -155,62 +230,326 @@ async def refresh_token(request: Request, response: Response):
     return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
 
 @app.get("/api/me", response_model=User)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
-    return current_user
+async def read_users_me(current_user: Principal = Depends(get_current_active_user)):
+    return current_user._asdict()
 
 @app.post("/api/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
+    for name in ("access_token", "refresh_token"):
+        token = request.cookies.get(name)
+        if token:
+            revoke_token(token[7:] if token.startswith("Bearer ") else token)
     response.delete_cookie("access_token")
     response.delete_cookie("refresh_token")
     response.delete_cookie("csrf_token")
     return {"message": "Logged out successfully"}
 
+# Responses are per-user (auth cookie) but cheap to revalidate via ETag
+CACHE_CONTROL = "private, no-cache"
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
 @app.get("/api/questions", response_model=List[Question])
-async def get_questions(topic: str, current_user: User = Depends(get_current_active_user)): # Protected
-    questions = get_questions_by_topic(topic)
-    if not questions:
+async def get_questions(topic: str, response: Response, if_none_match: Optional[str] = Header(None), current_user: Principal = Depends(get_current_active_user)): # Protected
+    etag = get_questions_etag(topic)
+    if etag is None:
         raise HTTPException(status_code=404, detail="Topic not found")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    questions = get_questions_by_topic(topic)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return questions
 
-@app.post("/api/submit", response_model=QuizResult)
-async def submit_quiz(attempt: Attempt, current_user: User = Depends(get_current_active_user)): # Protected
-    # Calculate score
-    score = calculate_score(attempt.answers)
+async def record_attempt(username: str, topic: str, answers: List[Answer], correct: List[bool], score: float, total_time: float, mean_confidence: float) -> QuizResult:
     category = determine_category(score)
-    
-    # In a real app, we would save the attempt to a DB here
-    
+    attempt = Attempt(
+        user_id=username,
+        topic=topic,
+        answers=answers,
+        score=score,
+        category=category,
+        created_at=datetime.utcnow(),
+    )
+    await asyncio.wrap_future(attempt_store.add(attempt))
+    item_stats.record_attempt(topic, [
+        (a.q_id, a.selected, a.time, a.confidence, ok) for a, ok in zip(answers, correct)
+    ])
+
     return QuizResult(
         score=score,
         category=category,
         breakdown={
             "accuracy": score,
-            "time": sum(a.time for a in attempt.answers),
-            "confidence": sum(a.confidence for a in attempt.answers) / len(attempt.answers) if attempt.answers else 0
+            "time": total_time,
+            "confidence": mean_confidence
         }
     )
 
+@app.post("/api/submit", response_model=QuizResult)
+async def submit_quiz(attempt: Attempt, current_user: Principal = Depends(get_current_active_user)): # Protected
+    correct = grade_answers(attempt.topic, attempt.answers)
+    # Recorded under the authenticated user, whatever the client sent
+    return await record_attempt(
+        current_user.username,
+        attempt.topic,
+        attempt.answers,
+        correct,
+        sum(correct) / len(correct) if correct else 0,
+        sum(a.time for a in attempt.answers),
+        sum(a.confidence for a in attempt.answers) / len(attempt.answers) if attempt.answers else 0,
+    )
+
+def quiz_session_state(session: QuizSession) -> QuizSessionState:
+    return QuizSessionState(
+        session_id=session.id,
+        topic=session.topic,
+        answered=list(session.answers),
+        expires_at=datetime.utcfromtimestamp(session.expires_at),
+    )
+
+def get_quiz_session(session_id: str, username: str) -> QuizSession:
+    session = quiz_sessions.get(session_id, username)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Quiz session not found or expired")
+    return session
+
+@app.post("/api/quiz-sessions", response_model=QuizSessionState)
+async def start_quiz_session(request: QuizSessionStart, current_user: Principal = Depends(get_current_active_user)): # Protected
+    # Resumes the user's unfinished session for the topic if there is one
+    return quiz_session_state(quiz_sessions.start(current_user.username, request.topic))
+
+@app.get("/api/quiz-sessions/{session_id}", response_model=QuizSessionState)
+async def read_quiz_session(session_id: str, current_user: Principal = Depends(get_current_active_user)): # Protected
+    return quiz_session_state(get_quiz_session(session_id, current_user.username))
+
+@app.post("/api/quiz-sessions/{session_id}/answers", response_model=QuizSessionState)
+async def answer_quiz_session(session_id: str, answer: Answer, current_user: Principal = Depends(get_current_active_user)): # Protected
+    session = get_quiz_session(session_id, current_user.username)
+    try:
+        quiz_sessions.answer(session, answer.q_id, answer.selected, answer.time, answer.confidence)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return quiz_session_state(session)
+
+@app.post("/api/quiz-sessions/{session_id}/finish", response_model=QuizResult)
+async def finish_quiz_session(session_id: str, current_user: Principal = Depends(get_current_active_user)): # Protected
+    # Scored from the session's running totals, then stored like /api/submit
+    session = get_quiz_session(session_id, current_user.username)
+    if not quiz_sessions.finish(session):
+        raise HTTPException(status_code=404, detail="Quiz session not found or expired")
+    answers = [
+        Answer(q_id=q_id, selected=a.selected, time=a.time, confidence=a.confidence)
+        for q_id, a in session.answers.items()
+    ]
+    correct = [a.correct for a in session.answers.values()]
+    return await record_attempt(current_user.username, session.topic, answers, correct, session.score, session.total_time, session.mean_confidence)
+
+@app.post("/api/adaptive/start", response_model=AdaptiveState)
+async def start_adaptive_test(request: AdaptiveStart, current_user: Principal = Depends(get_current_active_user)): # Protected
+    # Placement test that picks each question from the answers so far
+    questions = questions_db.get(request.topic)
+    if not questions:
+        raise HTTPException(status_code=404, detail=f"No questions for topic '{request.topic}'")
+    test = adaptive_engine.start(current_user.username, request.topic, questions)
+    return test.state()
+
+@app.post("/api/adaptive/{test_id}/answer", response_model=AdaptiveState)
+async def answer_adaptive_test(test_id: str, answer: AdaptiveAnswer, current_user: Principal = Depends(get_current_active_user)): # Protected
+    test = adaptive_engine.get(test_id, current_user.username)
+    if test is None:
+        raise HTTPException(status_code=404, detail="Adaptive test not found")
+    try:
+        adaptive_engine.answer(test, answer.q_id, answer.selected)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return test.state()
+
+class RequestFedStreamingResponse(StreamingResponse):
+    # The body iterator reads the request itself, so no task may listen on
+    # receive() for a disconnect meanwhile (it would swallow body chunks)
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/api/submit/batch")
+async def submit_batch(request: Request, format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"), current_user: Principal = Depends(get_current_admin_user)):
+    # Grades CSV or NDJSON attempts (see bulk_grading) and streams one NDJSON
+    # result per attempt, block by block as the upload arrives. Nothing is
+    # stored; this is for offline grading and re-scoring.
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    # Loads Data/questions.json into the key, as /quiz/submit grades against it
+    quiz.question_bank.questions()
+    with orm.SessionLocal() as db:
+        levels = [(level.name, level.min_score) for level in db.query(orm.Level)] or orm.DEFAULT_LEVELS
+
+    async def results():
+        header = None
+        graded = 0
+        async for block in aiter_line_blocks(request.stream()):
+            if format == "csv" and header is None:
+                header = block.pop(0)
+            lines = [header] + block if format == "csv" else block
+            try:
+                body, count = await run_in_threadpool(grade_lines, lines, format, answer_key, levels, graded)
+            except (ValueError, KeyError, TypeError) as e:
+                # Rows from "row" on, up to the next block, were not graded
+                yield json.dumps({"row": graded, "error": f"Invalid input: {e}"}).encode("utf-8") + b"\n"
+                return
+            graded += count
+            yield body
+
+    return RequestFedStreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/api/attempts", response_model=AttemptPage)
+def list_attempts(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Principal = Depends(get_current_active_user)
+): # Protected
+    # Newest first; follow next_cursor for older attempts
+    try:
+        items, next_cursor = attempt_store.history(current_user.username, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return AttemptPage(items=items, next_cursor=next_cursor)
+
+def get_topic_entry(topic: str):
+    # Topic files are named "{Topic}.md" and hold all levels
+    entry = content_index.get(topic)
+    if entry is None:
+         raise HTTPException(status_code=404, detail=f"Content for topic '{topic}' not found")
+    return entry
+
+def render_content(topic: str, level: str, preferences: List[str]) -> CachedBody:
+    # Serialized once per (topic, level, preferences, file version); the
+    # preference order is part of the key because it sets the block order
+    entry = get_topic_entry(topic)
+    preferences = normalize_preferences(preferences)
+    key = (topic, level, tuple(preferences), entry.version)
+    cached = content_cache.get(key)
+    if cached is None:
+        body = {
+            "topic": topic,
+            "level": level,
+            "blocks": [
+                {"type": b.type, "title": b.title, "body_md": b.body_md}
+                for b in entry.blocks(level, preferences)
+            ],
+        }
+        cached = CachedBody(
+            etag=make_etag("content", topic, level, ",".join(preferences), entry.version),
+            body=json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        )
+        content_cache.put(key, cached)
+    return cached
+
 @app.post("/api/content", response_model=ContentResponse)
-async def get_content(request: ContentRequest, current_user: User = Depends(get_current_active_user)): # Protected
-    # Construct file path based on topic and level
-    # Assuming file naming convention: "{Topic}_{Level}.md" or just "{Topic}.md"
-    # For this MVP, let's try "{Topic}.md" first
-    
-    filename = f"{request.topic}.md"
-    file_path = os.path.join(DATA_DIR, filename)
-    
-    if not os.path.exists(file_path):
-         # Try with level suffix if needed, or just fail gracefully
-         raise HTTPException(status_code=404, detail=f"Content for topic '{request.topic}' not found")
+async def get_content(request: ContentRequest, current_user: Principal = Depends(get_current_active_user)): # Protected
+    cached = render_content(request.topic, request.level, request.preferences)
+    return Response(content=cached.body, media_type="application/json")
 
-    blocks = parse_markdown_content(file_path, request.level, request.preferences)
-    
-    return ContentResponse(
-        topic=request.topic,
-        level=request.level,
-        blocks=blocks
+@app.get("/api/content", response_model=ContentResponse)
+async def get_content_conditional(
+    topic: str,
+    level: str,
+    preferences: List[str] = Query([]),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_active_user)
+): # Protected
+    # Same as POST /api/content, but revalidates against the topic file version
+    cached = render_content(topic, level, preferences)
+    if etag_matches(if_none_match, cached.etag):
+        return not_modified(cached.etag)
+    return Response(
+        content=cached.body,
+        media_type="application/json",
+        headers={"ETag": cached.etag, "Cache-Control": CACHE_CONTROL},
     )
 
+@app.get("/api/content/stream")
+async def stream_content(
+    topic: str,
+    level: str,
+    preferences: List[str] = Query([]),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_active_user)
+): # Protected
+    # Newline-delimited JSON, one ContentBlock per line, in the same order as
+    # /api/content. Each block is sent as soon as it is looked up.
+    entry = get_topic_entry(topic)
+    preferences = normalize_preferences(preferences)
+    etag = make_etag("content-stream", topic, level, ",".join(preferences), entry.version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    def ndjson():
+        for b in entry.select(level, preferences):
+            block = {"type": b.type, "title": b.title, "body_md": b.body_md}
+            yield json.dumps(block, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    return StreamingResponse(
+        ndjson(),
+        media_type="application/x-ndjson",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+@app.get("/api/search", response_model=List[SearchHit])
+async def search_content(
+    q: str,
+    level: Optional[str] = None,
+    types: List[str] = Query([]),
+    k: int = Query(10, ge=1, le=100),
+    current_user: Principal = Depends(get_current_active_user)
+): # Protected
+    return search_index.search(q, k=k, level=level, types=types)
+
+@app.get("/api/admin/persistence")
+async def persistence_stats(current_user: Principal = Depends(get_current_admin_user)):
+    # Group commit flush latency and batch sizes per store
+    return {"users": users_store.stats(), "questions": questions_store.stats(), "attempts": attempt_store.stats()}
+
+@app.get("/api/admin/password-pool")
+async def password_pool_stats(current_user: Principal = Depends(get_current_admin_user)):
+    # Queue wait and argon2 time for signups and logins
+    return password_pool.stats()
+
+@app.get("/api/admin/token-cache")
+async def token_cache_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return token_cache.stats()
+
+@app.get("/api/admin/rate-limit")
+async def rate_limit_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return rate_limit_backend.stats()
+
+@app.get("/api/admin/revocations")
+async def revocation_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return revocations.stats()
+
+@app.get("/api/admin/adaptive")
+async def adaptive_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return adaptive_engine.stats()
+
+@app.get("/api/admin/quiz-sessions")
+async def quiz_session_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return quiz_sessions.stats()
+
+@app.get("/api/admin/stats")
+async def item_statistics(topic: Optional[str] = None, current_user: Principal = Depends(get_current_admin_user)):
+    # Per-question difficulty, option choices, timing and discrimination,
+    # over every worker's graded attempts
+    return await run_in_threadpool(item_stats.report, topic)
+
+@app.get("/api/admin/item-stats")
+async def item_stats_status(current_user: Principal = Depends(get_current_admin_user)):
+    return item_stats.stats()
+
+@app.get("/api/topics")
+async def list_topics():
+    return content_index.list_topics()
+
 @app.get("/")
 async def root():
     return {"message": "FastAPI Backend is running"}
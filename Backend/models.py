@@ -1,12 +1,27 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, NamedTuple, Optional, Dict, Any, Union
 from datetime import datetime
+import sys
 
 class Question(BaseModel):
     id: int
     text: str
     options: List[str]
 
+class QuestionPublic(BaseModel):
+    # A question from Data/questions.json without its correct_index
+    id: int
+    text: str
+    options: List[str]
+    hint: Optional[str] = None
+
+class QuizSubmission(BaseModel):
+    # question id -> chosen option index
+    answers: Dict[str, int]
+    time_taken: float
+    confidence: int
+    hints_used: int = 0
+
 class Answer(BaseModel):
     q_id: int
     selected: str
@@ -21,6 +36,44 @@ class Attempt(BaseModel):
     category: Optional[str] = None
     created_at: Optional[datetime] = None
 
+class AttemptPage(BaseModel):
+    items: List[Attempt]
+    # Pass back as ?cursor= for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+class QuizSessionStart(BaseModel):
+    topic: str
+
+class QuizSessionState(BaseModel):
+    session_id: str
+    topic: str
+    # Ids of the questions answered so far, in order
+    answered: List[int]
+    expires_at: datetime
+
+class AdaptiveStart(BaseModel):
+    topic: str
+
+class AdaptiveAnswer(BaseModel):
+    q_id: int
+    # Option index, letter or text
+    selected: Union[int, str]
+
+class AdaptiveState(BaseModel):
+    test_id: str
+    topic: str
+    done: bool
+    # The next question; None once the test is done
+    question: Optional[QuestionPublic] = None
+    answered: int
+    correct: int
+    # Ability estimate (IRT theta) and its standard error
+    ability: float
+    standard_error: float
+    category: Optional[str] = None
+    # Posterior probability that category is right
+    category_probability: float
+
 class ContentRequest(BaseModel):
     topic: str
     level: str
@@ -36,6 +89,14 @@ class ContentResponse(BaseModel):
     level: str
     blocks: List[ContentBlock]
 
+class SearchHit(BaseModel):
+    topic: str
+    level: Optional[str] = None
+    type: str
+    title: str
+    body_md: str
+    score: float
+
 class QuizResult(BaseModel):
     score: float
     category: str
@@ -48,6 +109,40 @@ class User(BaseModel):
 class UserInDB(User):
     hashed_password: str
 
+class Principal(NamedTuple):
+    """
+    Authenticated user as seen by endpoints. Immutable and built once per
+    user, so the auth dependency does no validation per request.
+    """
+    username: str
+    role: str
+
+class UserRecord:
+    """
+    In-memory user row. Slotted, with role strings interned, so a million
+    users cost a fraction of a dict each.
+    """
+    __slots__ = ("username", "role", "hashed_password", "_principal")
+
+    def __init__(self, username: str, hashed_password: str, role: str = "user"):
+        self.username = username
+        self.role = sys.intern(role)
+        self.hashed_password = hashed_password
+        self._principal = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserRecord":
+        return cls(data["username"], data["hashed_password"], data.get("role", "user"))
+
+    def to_dict(self) -> dict:
+        return {"username": self.username, "role": self.role, "hashed_password": self.hashed_password}
+
+    @property
+    def principal(self) -> Principal:
+        if self._principal is None:
+            self._principal = Principal(self.username, self.role)
+        return self._principal
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,115 @@
+"""
+SQLAlchemy data layer for the routers package (/quiz and /content).
+
+One engine with a bounded connection pool is shared by the process;
+get_db hands each request a session that returns its connection to the
+pool when the request ends.
+"""
+import os
+
+from sqlalchemy import JSON, Column, Float, ForeignKey, Integer, String, create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+# Under data_storage/ (gitignored): SQLite rewrites the file on first use
+DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "sql_app.db")
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DATABASE_FILE}")
+
+# Connections kept open, and extra ones allowed under bursts
+POOL_SIZE = 8
+MAX_OVERFLOW = 16
+POOL_TIMEOUT = 10
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    # Sessions are used from the threadpool, one thread at a time
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {},
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_pre_ping=not SQLALCHEMY_DATABASE_URL.startswith("sqlite"),
+)
+
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the writer; busy_timeout makes
+        # writers queue instead of failing with "database is locked"
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # The username the user logs in with
+    email = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    full_name = Column(String)
+    level = Column(String, default="Beginner")
+    preferences = Column(JSON)
+
+class Level(Base):
+    __tablename__ = "levels"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    # Lowest quiz score that places a user at this level
+    min_score = Column(Float, nullable=False)
+
+class QuizResult(Base):
+    __tablename__ = "quiz_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    score = Column(Float)
+    category = Column(String)
+    details = Column(JSON)
+
+DEFAULT_LEVELS = [
+    ("Beginner", 0.0),
+    ("Intermediate", 0.45),
+    ("Advanced", 0.75),
+]
+
+def init_db():
+    """
+    Creates missing tables and seeds the levels. Existing tables are left
+    as they are.
+    """
+    if SQLALCHEMY_DATABASE_URL == f"sqlite:///{DATABASE_FILE}":
+        os.makedirs(os.path.dirname(DATABASE_FILE), exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.query(Level).count() == 0:
+            db.add_all(Level(name=name, min_score=min_score) for name, min_score in DEFAULT_LEVELS)
+            db.commit()
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_or_create_user(db: Session, username: str) -> User:
+    # Accounts live in the user store; rows here are created on first use
+    user = db.query(User).filter(User.email == username).first()
+    if user is None:
+        user = User(email=username, level="Beginner")
+        db.add(user)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Created by a concurrent request
+            db.rollback()
+            user = db.query(User).filter(User.email == username).one()
+    return user
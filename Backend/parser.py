@@ -1,6 +1,7 @@
 import re
 import yaml
 import os
+from typing import Iterator, List, Tuple
 
 def parse_markdown(file_path: str, level: str):
     if not os.path.exists(file_path):
@@ -23,6 +24,7 @@ def parse_markdown(file_path: str, level: str):
     # Extract Level Content
     # Pattern: <!-- Level --> ... <!-- /Level -->
     # Case insensitive search for level
+    level = re.escape(level)
     pattern = re.compile(f"<!--\\s*{level}\\s*-->(.*?)<!--\\s*/{level}\\s*-->", re.DOTALL | re.IGNORECASE)
     match = pattern.search(content)
 
@@ -31,27 +33,26 @@ def parse_markdown(file_path: str, level: str):
     
     return frontmatter, None
 
-def get_all_topics(data_dir: str):
-    topics = []
-    if not os.path.exists(data_dir):
-        return topics
-        
-    for filename in os.listdir(data_dir):
-        if filename.endswith(".md"):
-            file_path = os.path.join(data_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                # Read just the first bit to get frontmatter
-                content = f.read(1024) 
-                if content.startswith("---"):
-                    try:
-                        parts = content.split("---", 2)
-                        if len(parts) >= 2:
-                            fm = yaml.safe_load(parts[1])
-                            topics.append({
-                                "filename": filename,
-                                "topic": fm.get("topic", filename),
-                                "auth_required": fm.get("auth_required", False)
-                            })
-                    except:
-                        pass
-    return topics
+def read_frontmatter(lines: Iterator[str]) -> Tuple[dict, List[str]]:
+    """
+    Reads the YAML frontmatter between the leading --- lines of a file.
+    Returns (frontmatter, lines consumed) so callers can keep scanning.
+    """
+    first = next(lines, None)
+    if first is None:
+        return {}, []
+    if not first.startswith("---"):
+        return {}, [first]
+
+    consumed = [first]
+    for line in lines:
+        consumed.append(line)
+        if line.startswith("---"):
+            try:
+                frontmatter = yaml.safe_load("".join(consumed[1:-1]))
+            except yaml.YAMLError as e:
+                print(f"Error parsing frontmatter: {e}")
+                return {}, consumed
+            return (frontmatter if isinstance(frontmatter, dict) else {}), consumed
+    # No closing ---, so it wasn't frontmatter
+    return {}, consumed
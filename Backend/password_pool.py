@@ -0,0 +1,164 @@
+"""
+Argon2 hashing and verification off the event loop.
+
+Jobs run in a small process pool so a burst of logins can't starve the
+loop (or each other, via the GIL). Admission is bounded: once workers plus
+MAX_QUEUE_DEPTH jobs are in flight, new jobs are refused with PoolSaturated
+straight away instead of queueing behind a storm.
+
+The worker functions live here, away from the app modules, so worker
+processes start without importing FastAPI or the data layer.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+POOL_WORKERS = int(os.environ.get("PASSWORD_POOL_WORKERS", max(1, min(4, (os.cpu_count() or 1)))))
+# Jobs allowed to wait for a worker, on top of the ones running
+MAX_QUEUE_DEPTH = int(os.environ.get("PASSWORD_POOL_QUEUE", 32))
+
+_context = None
+
+def _init_worker():
+    global _context
+    from passlib.context import CryptContext
+    _context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+def _warm_up():
+    pass
+
+def _hash(password: str) -> Tuple[str, float]:
+    started = time.perf_counter()
+    return _context.hash(password), time.perf_counter() - started
+
+def _verify(password: str, hashed_password: str) -> Tuple[bool, float]:
+    started = time.perf_counter()
+    try:
+        ok = _context.verify(password, hashed_password)
+    except ValueError:
+        # Malformed stored hash
+        ok = False
+    return ok, time.perf_counter() - started
+
+class PoolSaturated(Exception):
+    pass
+
+class PoolBroken(PoolSaturated):
+    """
+    A worker died mid-job. The pool has been replaced; the job can be retried.
+    """
+
+class PasswordPool:
+    def __init__(self, workers: int = POOL_WORKERS, max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.workers = workers
+        self.max_in_flight = workers + max_queue_depth
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.peak_in_flight = 0
+        self.rebuilt = 0
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.max_hash_seconds = 0.0
+
+    def start(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Not fork: the app process already runs threads
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                )
+                # Start the workers now rather than on the first login
+                for _ in range(self.workers):
+                    self._executor.submit(_warm_up)
+            return self._executor
+
+    def _replace(self, broken: ProcessPoolExecutor):
+        # A broken executor refuses every later job, so drop it and let the
+        # next job start a fresh one
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.rebuilt += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise PoolSaturated()
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+
+    async def _run(self, fn, *args):
+        self._admit()
+        submitted = time.perf_counter()
+        executor = None
+        try:
+            executor = self.start()
+            result, hash_seconds = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise PoolBroken()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        # Whatever the job didn't spend hashing it spent queued or in transit
+        queue_wait = max(0.0, time.perf_counter() - submitted - hash_seconds)
+        with self._lock:
+            self.completed += 1
+            self.queue_wait_seconds += queue_wait
+            self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, queue_wait)
+            self.hash_seconds += hash_seconds
+            self.max_hash_seconds = max(self.max_hash_seconds, hash_seconds)
+        return result
+
+    async def hash(self, password: str) -> str:
+        """
+        Raises PoolSaturated if the queue is full or PoolBroken if a worker
+        died.
+        """
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Raises PoolSaturated if the queue is full or PoolBroken if a worker
+        died.
+        """
+        return await self._run(_verify, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "workers": self.workers,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rebuilt": self.rebuilt,
+                "avg_queue_wait_ms": round(self.queue_wait_seconds / completed * 1000, 3),
+                "max_queue_wait_ms": round(self.max_queue_wait_seconds * 1000, 3),
+                "avg_hash_ms": round(self.hash_seconds / completed * 1000, 3),
+                "max_hash_ms": round(self.max_hash_seconds * 1000, 3),
+            }
+
+password_pool = PasswordPool()
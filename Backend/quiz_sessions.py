@@ -0,0 +1,278 @@
+"""
+Server-side quiz sessions: a quiz is started, answered one question at a
+time and then finished, so a browser refresh doesn't lose it.
+
+Each answer is graded when it arrives and folded into the session's running
+totals (correct, time, confidence), so finishing reads the totals instead
+of regrading the quiz.
+
+Sessions expire ttl seconds after their last use. The store is ordered by
+last use, which is also expiry order, so expired sessions are dropped from
+the front in O(1) each; past max_sessions the least recently used goes
+first. With a snapshot path, the sessions changed or dropped since the
+last snapshot are merged into the file every snapshot_interval seconds (and
+on close) under a file lock, so processes sharing the file keep each
+other's sessions, and the file is reloaded on open.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from answer_key import answer_key
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; concurrent snapshots there may lose updates
+    fcntl = None
+
+SNAPSHOT_FILE = os.environ.get(
+    "QUIZ_SESSION_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "quiz_sessions.json"),
+)
+
+class SessionAnswer(NamedTuple):
+    selected: str
+    time: float
+    confidence: int
+    correct: bool
+
+class QuizSession:
+    __slots__ = ("id", "username", "topic", "created_at", "expires_at", "answers", "correct", "total_time", "confidence_sum")
+
+    def __init__(self, session_id: str, username: str, topic: str, created_at: float, expires_at: float):
+        self.id = session_id
+        self.username = username
+        self.topic = topic
+        self.created_at = created_at
+        self.expires_at = expires_at
+        # q_id -> answer, in the order first answered
+        self.answers: Dict[int, SessionAnswer] = {}
+        self.correct = 0
+        self.total_time = 0.0
+        self.confidence_sum = 0
+
+    def record(self, q_id: int, answer: SessionAnswer):
+        # Answering a question again replaces the earlier answer
+        previous = self.answers.get(q_id)
+        if previous is not None:
+            self.correct -= previous.correct
+            self.total_time -= previous.time
+            self.confidence_sum -= previous.confidence
+        self.answers[q_id] = answer
+        self.correct += answer.correct
+        self.total_time += answer.time
+        self.confidence_sum += answer.confidence
+
+    @property
+    def score(self) -> float:
+        # Same as /api/submit: the fraction of answers that are correct
+        return self.correct / len(self.answers) if self.answers else 0
+
+    @property
+    def mean_confidence(self) -> float:
+        return self.confidence_sum / len(self.answers) if self.answers else 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "username": self.username,
+            "topic": self.topic,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+            "answers": [[q_id, a.selected, a.time, a.confidence, a.correct] for q_id, a in self.answers.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuizSession":
+        session = cls(data["id"], data["username"], data["topic"], data["created_at"], data["expires_at"])
+        for q_id, selected, spent, confidence, correct in data["answers"]:
+            session.record(q_id, SessionAnswer(selected, spent, confidence, correct))
+        return session
+
+class SessionStore:
+    def __init__(self, ttl: float = 2 * 3600, max_sessions: int = 50000, snapshot_path: Optional[str] = SNAPSHOT_FILE, snapshot_interval: float = 30.0):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.snapshot_path = snapshot_path or None
+        self.snapshot_interval = snapshot_interval
+        # Least recently used (soonest to expire) first
+        self._sessions: "OrderedDict[str, QuizSession]" = OrderedDict()
+        # (username, topic) -> session id, so starting again resumes
+        self._active: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        # Session ids changed and dropped since the last snapshot
+        self._changed: Set[str] = set()
+        self._dropped: Set[str] = set()
+        self._stop = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+        self.started = 0
+        self.finished = 0
+        self.expired = 0
+        self.evicted = 0
+        self.snapshots = 0
+
+    def open(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            sessions = [QuizSession.from_dict(d) for d in data.get("sessions", [])]
+            with self._lock:
+                for session in sorted(sessions, key=lambda s: s.expires_at):
+                    if session.expires_at > now:
+                        self._insert(session)
+        if self.snapshot_path:
+            self._stop.clear()
+            self._snapshotter = threading.Thread(target=self._run_snapshotter, name="quiz-session-snapshot", daemon=True)
+            self._snapshotter.start()
+
+    def close(self):
+        if self._snapshotter is not None:
+            self._stop.set()
+            self._snapshotter.join()
+            self._snapshotter = None
+        if self.snapshot_path:
+            self.snapshot()
+
+    def _insert(self, session: QuizSession):
+        self._sessions[session.id] = session
+        self._active[(session.username, session.topic)] = session.id
+
+    def _remove(self, session: QuizSession):
+        self._sessions.pop(session.id, None)
+        key = (session.username, session.topic)
+        if self._active.get(key) == session.id:
+            del self._active[key]
+        self._changed.discard(session.id)
+        self._dropped.add(session.id)
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at > now:
+                break
+            self._remove(session)
+            self.expired += 1
+
+    def _touch(self, session: QuizSession, now: float):
+        session.expires_at = now + self.ttl
+        self._sessions.move_to_end(session.id)
+        self._changed.add(session.id)
+
+    def start(self, username: str, topic: str) -> QuizSession:
+        """
+        Starts a session, or returns the user's unfinished one for the topic.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session_id = self._active.get((username, topic))
+            if session_id is not None:
+                session = self._sessions[session_id]
+                self._touch(session, now)
+                return session
+            session = QuizSession(secrets.token_urlsafe(16), username, topic, now, now + self.ttl)
+            self._insert(session)
+            if len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions.values())))
+                self.evicted += 1
+            self.started += 1
+            self._changed.add(session.id)
+            return session
+
+    def get(self, session_id: str, username: str) -> Optional[QuizSession]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None or session.username != username:
+                return None
+            self._touch(session, now)
+            return session
+
+    def answer(self, session: QuizSession, q_id: int, selected: str, spent: float, confidence: int):
+        """
+        Grades and records an answer. Raises ValueError if the question isn't
+        one of the session topic's.
+        """
+        if answer_key.lookup(session.topic, q_id) is None:
+            raise ValueError(f"Question {q_id} is not in topic '{session.topic}'")
+        correct = answer_key.is_correct(session.topic, q_id, selected)
+        with self._lock:
+            session.record(q_id, SessionAnswer(selected, spent, confidence, correct))
+            self._changed.add(session.id)
+
+    def finish(self, session: QuizSession) -> bool:
+        """
+        Closes the session. False if it was already finished or expired.
+        """
+        with self._lock:
+            if self._sessions.get(session.id) is not session:
+                return False
+            self._remove(session)
+            self.finished += 1
+            return True
+
+    def snapshot(self):
+        """
+        Merges the sessions changed or dropped since the last snapshot into
+        the snapshot file.
+        """
+        with self._lock:
+            changed = {sid: self._sessions[sid].to_dict() for sid in self._changed}
+            dropped = self._dropped
+            self._changed, self._dropped = set(), set()
+        os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+        try:
+            with open(f"{self.snapshot_path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                sessions = {}
+                if os.path.exists(self.snapshot_path):
+                    with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                        sessions = {d["id"]: d for d in json.load(f).get("sessions", [])}
+                now = time.time()
+                sessions = {sid: d for sid, d in sessions.items() if sid not in dropped and d["expires_at"] > now}
+                sessions.update(changed)
+                tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"sessions": list(sessions.values())}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+        except (OSError, ValueError):
+            # Keep the changes for the next try
+            with self._lock:
+                self._changed.update(sid for sid in changed if sid in self._sessions)
+                self._dropped.update(sid for sid in dropped if sid not in self._sessions)
+            raise
+        self.snapshots += 1
+
+    def _run_snapshotter(self):
+        while not self._stop.wait(self.snapshot_interval):
+            with self._lock:
+                self._expire(time.time())
+                dirty = bool(self._changed or self._dropped)
+            if dirty:
+                try:
+                    self.snapshot()
+                except (OSError, ValueError) as e:
+                    print(f"Quiz session snapshot failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "started": self.started,
+                "finished": self.finished,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "snapshots": self.snapshots,
+            }
+
+quiz_sessions = SessionStore()
@@ -0,0 +1,242 @@
+"""
+Token-bucket rate limiting for the credential endpoints.
+
+RateLimitMiddleware charges one token per request to a bucket for the
+client IP and one for the submitted username, and answers 429 with
+Retry-After when either is empty, before the endpoint (and argon2) runs.
+
+The client IP is the connection's peer address, except for peers listed in
+RATE_LIMIT_TRUSTED_PROXIES (loopback by default): requests from those are
+keyed on the last X-Forwarded-For entry. The Streamlit frontend calls the
+API from 127.0.0.1 and forwards the browser's address that way. A trusted
+peer that sends no X-Forwarded-For gets no per-IP limit at all, since its
+address would put every user behind it in one bucket; only the per-username
+limit applies then.
+
+The username is read from JSON, urlencoded or multipart bodies. Requests
+whose username can't be read all share one per-username bucket, and bodies
+over MAX_BODY_BYTES are refused with 413, so neither skips the limit.
+
+Bucket state lives behind RateLimitBackend, so the in-process
+MemoryBackend can be swapped for a shared store (e.g. Redis) when the
+backend runs as several processes.
+"""
+import email.parser
+import email.policy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+
+class RateLimit(NamedTuple):
+    # Bucket size: requests allowed back to back
+    burst: int
+    # Refill rate in requests per second
+    rate: float
+
+class RouteLimits(NamedTuple):
+    per_ip: Optional[RateLimit] = None
+    per_username: Optional[RateLimit] = None
+
+# Path -> limits, only for POST requests
+RATE_LIMITS: Dict[str, RouteLimits] = {
+    "/api/login": RouteLimits(per_ip=RateLimit(burst=20, rate=20 / 60), per_username=RateLimit(burst=5, rate=5 / 60)),
+    "/api/signup": RouteLimits(per_ip=RateLimit(burst=10, rate=10 / 60), per_username=RateLimit(burst=3, rate=3 / 60)),
+}
+
+TRUSTED_PROXIES = frozenset(
+    ip.strip() for ip in os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if ip.strip()
+)
+
+# Only this much of a request body is read to find the username
+MAX_BODY_BYTES = 16 * 1024
+
+class RateLimitBackend:
+    """
+    Stores buckets. hit() must be atomic per key.
+    """
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> float:
+        """
+        Takes one token from the key's bucket. Returns 0 if allowed, else
+        the seconds until a token is available.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+class MemoryBackend(RateLimitBackend):
+    """
+    In-process buckets: O(1) per check, at most max_keys buckets. Buckets
+    idle long enough to have refilled are swept every sweep_interval
+    seconds; past max_keys the least recently used bucket is dropped.
+    """
+
+    def __init__(self, max_keys: int = 100000, sweep_interval: float = 60.0):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        # key -> [tokens, last update, seconds to refill from empty]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.allowed = 0
+        self.limited = 0
+        self.swept = 0
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> float:
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(limit.burst), now, limit.burst / limit.rate]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(limit.burst), bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (1 - bucket[0]) / limit.rate
+
+    def _sweep(self, now: float):
+        # A bucket untouched for its full refill time is back at burst, so
+        # forgetting it changes nothing
+        idle = [key for key, (_, last, refill) in self._buckets.items() if now - last >= refill]
+        for key in idle:
+            del self._buckets[key]
+        self.swept += len(idle)
+        self._next_sweep = now + self.sweep_interval
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited, "swept": self.swept}
+
+def client_ip(scope, trusted_proxies: frozenset = TRUSTED_PROXIES) -> Optional[str]:
+    """
+    The address to rate limit, or None when a trusted proxy didn't say.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if peer not in trusted_proxies:
+        return peer
+    headers = dict(scope.get("headers") or [])
+    forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1")
+    # The proxy appends the address it saw; earlier entries are client-supplied
+    last = forwarded.rsplit(",", 1)[-1].strip()
+    return last or None
+
+def _multipart_field(body: bytes, content_type: str, name: str) -> Optional[str]:
+    # The body is parsed as a MIME message under the request's Content-Type
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    if not message.is_multipart():
+        return None
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == name:
+            return part.get_payload(decode=True).decode("utf-8")
+    return None
+
+def extract_username(body: bytes, content_type: str) -> Optional[str]:
+    try:
+        if content_type.startswith("application/json"):
+            data = json.loads(body)
+            username = data.get("username") if isinstance(data, dict) else None
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            username = parse_qs(body.decode("utf-8")).get("username", [None])[0]
+        elif content_type.startswith("multipart/form-data"):
+            username = _multipart_field(body, content_type, "username")
+        else:
+            return None
+    except (ValueError, LookupError, AttributeError):
+        return None
+    return username if isinstance(username, str) else None
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware. The body of a limited route is buffered (up to
+    MAX_BODY_BYTES) to read the username and then replayed to the app.
+    """
+
+    def __init__(self, app, limits: Dict[str, RouteLimits] = None, backend: Optional[RateLimitBackend] = None, trusted_proxies: frozenset = TRUSTED_PROXIES):
+        self.app = app
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.backend = backend or MemoryBackend()
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        limits = self.limits.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limits is None:
+            await self.app(scope, receive, send)
+            return
+
+        now = time.monotonic()
+        path = scope["path"]
+        retry_after = 0.0
+        ip = client_ip(scope, self.trusted_proxies) if limits.per_ip is not None else None
+        if ip is not None:
+            retry_after = self.backend.hit(f"{path}|ip|{ip}", limits.per_ip, now)
+
+        if retry_after == 0 and limits.per_username is not None:
+            body, complete, receive = await self._buffer_body(receive)
+            if not complete:
+                await self._reject(send, 413, "Request body too large")
+                return
+            headers = dict(scope.get("headers") or [])
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            username = extract_username(body, content_type)
+            # Unreadable usernames share one bucket rather than going unlimited
+            key = username.lower() if username else ""
+            retry_after = self.backend.hit(f"{path}|user|{key}", limits.per_username, now)
+
+        if retry_after > 0:
+            await self._reject(send, 429, "Too many attempts, please retry later", retry_after)
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _buffer_body(receive) -> Tuple[bytes, bool, object]:
+        """
+        Returns (body, whether it is the whole body, replaying receive).
+        """
+        messages = []
+        chunks = []
+        size = 0
+        more = True
+        while more and size <= MAX_BODY_BYTES:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            size += len(chunk)
+            more = message.get("more_body", False)
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return b"".join(chunks), size <= MAX_BODY_BYTES, replay
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float = 0.0):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        if retry_after > 0:
+            headers.append((b"retry-after", str(max(1, int(retry_after + 0.999))).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
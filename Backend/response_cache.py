@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional, Tuple
+
+class CachedBody(NamedTuple):
+    etag: str
+    body: bytes
+
+def _entry_size(key: Hashable, cached: CachedBody) -> int:
+    # Keys can hold client-supplied strings, so they count too
+    return len(repr(key)) + len(cached.etag) + len(cached.body)
+
+class ResponseCache:
+    """
+    Bounded LRU cache of ready-to-send response bodies.
+
+    Size is bounded by the total bytes held (bodies, ETags and keys) and by
+    the number of entries. Keys should include everything the body depends
+    on (e.g. the topic file version), so stale entries are simply never
+    asked for again and age out.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entries: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (body, its size)
+        self._entries: "OrderedDict[Hashable, Tuple[CachedBody, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, cached: CachedBody):
+        size = _entry_size(key, cached)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (cached, size)
+            self.size += size
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,226 @@
+"""
+Revoked token ids (jti), held only until the token would have expired.
+
+Lookups go through a Bloom filter first: for a token that was never
+revoked (nearly every request) it answers "no" from a few bit tests.
+Revoked ids sit in a timing wheel of one-minute slots, so expiring them
+costs one slot per minute rather than a scan. The filter can't delete, so
+it is rebuilt from the live ids once enough of them have expired.
+
+With a log path, revocations are shared between worker processes: each one
+is appended to the log (one JSON line, under a file lock), and every check
+first stats the log and reads any lines added since the last check, so a
+token revoked by one worker is refused by all of them from then on. Once
+the log passes COMPACT_THRESHOLD_BYTES it is rewritten, under the same
+lock, with only the ids that haven't expired; readers notice the new file
+by its inode and read it from the start.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; concurrent revocations there may be lost
+    fcntl = None
+
+LOG_FILE = os.environ.get(
+    "REVOCATION_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "revocations.log"),
+)
+COMPACT_THRESHOLD_BYTES = 1024 * 1024
+
+# Wheel slot width in seconds and number of slots. Ids expiring beyond one
+# turn of the wheel stay in their slot until a later turn reaches them.
+WHEEL_RESOLUTION = 60
+WHEEL_SLOTS = 1024
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+class RevocationList:
+    def __init__(self, capacity: int = 100000, resolution: int = WHEEL_RESOLUTION, slots: int = WHEEL_SLOTS, log_path: Optional[str] = LOG_FILE):
+        self.capacity = capacity
+        self.log_path = log_path or None
+        # (inode, offset) of the log read so far
+        self._log_ino = None
+        self._log_offset = 0
+        self.resolution = resolution
+        self._exp: Dict[str, float] = {}
+        self._wheel: List[Set[str]] = [set() for _ in range(slots)]
+        self._tick = int(time.time() // resolution)
+        self._bloom = BloomFilter(capacity)
+        self._expired_since_rebuild = 0
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.bloom_negatives = 0
+        self.compactions = 0
+
+    def _add(self, jti: str, exp: float, now: float):
+        if exp <= now or jti in self._exp:
+            return
+        self._exp[jti] = exp
+        self._wheel[int(exp // self.resolution) % len(self._wheel)].add(jti)
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild()
+        else:
+            self._bloom.add(jti)
+
+    def revoke(self, jti: str, exp: float):
+        now = time.time()
+        if exp <= now:
+            return
+        with self._lock:
+            self._advance(now)
+            self._add(jti, exp, now)
+        if self.log_path:
+            self._append(jti, exp)
+
+    def _append(self, jti: str, exp: float):
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        with open(f"{self.log_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Opened per append, so it never writes to a compacted-away file
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps([jti, exp]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.getsize(self.log_path) > COMPACT_THRESHOLD_BYTES:
+                self._compact()
+
+    def _compact(self):
+        # Called with the file lock held
+        now = time.time()
+        live: Dict[str, float] = {}
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    jti, exp = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                if exp > now:
+                    live[jti] = exp
+        tmp_path = f"{self.log_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for jti, exp in live.items():
+                f.write(json.dumps([jti, exp]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        self.compactions += 1
+
+    def _sync(self):
+        """
+        Reads the log lines other processes (or this one) added since the
+        last call. One stat when nothing changed.
+        """
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return
+        if st.st_ino == self._log_ino and st.st_size == self._log_offset:
+            return
+        with self._lock:
+            with open(self.log_path, "rb") as f:
+                ino = os.fstat(f.fileno()).st_ino
+                if ino != self._log_ino:
+                    self._log_ino = ino
+                    self._log_offset = 0
+                f.seek(self._log_offset)
+                data = f.read()
+            # A line still being appended is read on a later call
+            end = data.rfind(b"\n") + 1
+            now = time.time()
+            self._advance(now)
+            for line in data[:end].splitlines():
+                try:
+                    jti, exp = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                self._add(jti, exp, now)
+            self._log_offset += end
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if jti is None:
+            return False
+        self.checks += 1
+        if self.log_path:
+            self._sync()
+        if jti not in self._bloom:
+            self.bloom_negatives += 1
+            return False
+        now = time.time()
+        with self._lock:
+            self._advance(now)
+            exp = self._exp.get(jti)
+            return exp is not None and exp > now
+
+    def _advance(self, now: float):
+        # Expire every slot the clock has passed since the last call
+        tick = int(now // self.resolution)
+        if tick <= self._tick:
+            return
+        slots = len(self._wheel)
+        for t in range(self._tick, min(tick, self._tick + slots)):
+            slot = self._wheel[t % slots]
+            expired = [jti for jti in slot if self._exp[jti] <= now]
+            for jti in expired:
+                slot.discard(jti)
+                del self._exp[jti]
+            self._expired_since_rebuild += len(expired)
+        self._tick = tick
+        if self._expired_since_rebuild > max(1024, len(self._exp)):
+            self._rebuild()
+
+    def _rebuild(self):
+        capacity = max(self.capacity, 2 * len(self._exp))
+        bloom = BloomFilter(capacity)
+        for jti in self._exp:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._expired_since_rebuild = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "revoked": len(self._exp),
+                "bloom_bits": self._bloom.size,
+                "bloom_hashes": self._bloom.hashes,
+                "checks": self.checks,
+                "bloom_negatives": self.bloom_negatives,
+                "log_bytes": self._log_offset,
+                "compactions": self.compactions,
+            }
+
+revocations = RevocationList()
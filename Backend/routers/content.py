@@ -1,20 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-import database, models, auth, parser
+import orm, auth, parser
+from content_index import content_index
 import os
 
 router = APIRouter()
 
 # Dynamic path to data folder
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DATA_DIR = os.path.join(BASE_DIR, "data", "topics")
+DATA_DIR = os.path.join(BASE_DIR, "Data", "topics")
+
+def topic_file(name: str):
+    # Only files inside DATA_DIR; "../" or absolute names resolve elsewhere
+    file_path = os.path.realpath(os.path.join(DATA_DIR, name))
+    if os.path.commonpath([file_path, os.path.realpath(DATA_DIR)]) != os.path.realpath(DATA_DIR):
+        return None
+    return file_path if os.path.isfile(file_path) else None
 
 @router.get("/list")
 def list_topics():
-    return parser.get_all_topics(DATA_DIR)
+    # Served from the in-memory topic catalog
+    return content_index.list_topics()
 
 @router.get("/get")
-def get_content(topic: str, level: str = None, current_user: models.User = Depends(auth.get_current_user)):
+def get_content(topic: str, level: str = None, current_user: orm.User = Depends(auth.get_current_user)):
     # If level not provided, use user's level
     if not level:
         level = current_user.level
@@ -27,11 +36,11 @@ def get_content(topic: str, level: str = None, current_user: models.User = Depen
     # We expect topic to be the filename for simplicity in this MVP, or we map it.
     # Let's assume topic param IS the filename (e.g. "Binary Trees.md")
     
-    file_path = os.path.join(DATA_DIR, topic)
-    if not os.path.exists(file_path):
+    file_path = topic_file(topic)
+    if file_path is None:
         # Try adding .md
-        file_path = os.path.join(DATA_DIR, topic + ".md")
-        if not os.path.exists(file_path):
+        file_path = topic_file(topic + ".md")
+        if file_path is None:
             raise HTTPException(status_code=404, detail="Topic not found")
             
     frontmatter, content = parser.parse_markdown(file_path, level)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-import database, models, auth
-import json
+import orm, models, auth
+from answer_key import FileBank, answer_key
 import os
 from typing import List
 
@@ -10,38 +10,26 @@ router = APIRouter()
 # Dynamic path to data folder
 # backend/routers/quiz.py -> backend/routers -> backend -> CAPSTONE -> data
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-QUESTIONS_FILE = os.path.join(BASE_DIR, "data", "questions.json")
+QUESTIONS_FILE = os.path.join(BASE_DIR, "Data", "questions.json")
 
-def load_questions():
-    if os.path.exists(QUESTIONS_FILE):
-        with open(QUESTIONS_FILE, "r") as f:
-            return json.load(f)
-    return []
+# Compiled under topic None; reloaded only when the file changes
+question_bank = FileBank(QUESTIONS_FILE, answer_key)
 
 @router.get("/questions", response_model=List[models.QuestionPublic])
-def get_questions(current_user: models.User = Depends(auth.get_current_user)):
-    questions = load_questions()
-    # Hide correct answer for frontend
-    public_questions = []
-    for q in questions:
-        pq = q.copy()
-        if "correct_index" in pq:
-            del pq["correct_index"]
-        public_questions.append(pq)
-    return public_questions
+def get_questions(current_user: orm.User = Depends(auth.get_current_user)):
+    # Correct answers are stripped once per load
+    return question_bank.public_questions()
 
 @router.post("/submit")
-def submit_quiz(submission: models.QuizSubmission, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    questions = load_questions()
-    correct_count = 0
-    total_questions = len(questions)
+def submit_quiz(submission: models.QuizSubmission, db: Session = Depends(orm.get_db), current_user: orm.User = Depends(auth.get_current_user)):
+    total_questions = len(question_bank.questions())
     
-    # Calculate Accuracy
-    for q_id, answer_index in submission.answers.items():
-        # Find question by ID (assuming simple list index or id match)
-        question = next((q for q in questions if q["id"] == int(q_id)), None)
-        if question and question["correct_index"] == answer_index:
-            correct_count += 1
+    # Calculate Accuracy: one answer key lookup per answer
+    correct_count = sum(
+        answer_key.is_correct(None, int(q_id), answer_index)
+        for q_id, answer_index in submission.answers.items()
+        if q_id.isdigit()
+    )
             
     accuracy = correct_count / total_questions if total_questions > 0 else 0
     
@@ -63,20 +51,21 @@ def submit_quiz(submission: models.QuizSubmission, db: Session = Depends(databas
     raw_score = (0.5 * accuracy) + (0.15 * time_component) + (0.15 * confidence_component) + (0.15 * difficulty_score) - (0.1 * hints_penalty)
     score = max(0, min(1, raw_score))
     
-    # Determine Category
-    if score < 0.45:
-        category = "Beginner"
-    elif score < 0.75:
-        category = "Intermediate"
-    else:
-        category = "Advanced"
+    # Determine Category: the highest level whose threshold the score reaches
+    level = (
+        db.query(orm.Level)
+        .filter(orm.Level.min_score <= score)
+        .order_by(orm.Level.min_score.desc())
+        .first()
+    )
+    category = level.name if level is not None else "Beginner"
         
     # Update User
     current_user.level = category
     db.commit()
     
     # Save Result
-    result = models.QuizResult(
+    result = orm.QuizResult(
         user_id=current_user.id,
         score=score,
         category=category,
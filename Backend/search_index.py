@@ -0,0 +1,192 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+class SearchDoc(NamedTuple):
+    topic: str
+    # Level section the block is in (lower-cased), None if outside any
+    level: Optional[str]
+    type: str
+    # Where the block sits in the topic: (level table or None for the
+    # whole-file table, block type, position). Bodies aren't kept here;
+    # hits are looked up in the content index.
+    ref: Tuple[Optional[str], str, int]
+    length: int
+
+class SearchIndex:
+    """
+    Inverted index over every content block, ranked with BM25.
+
+    Topics are (re)indexed one at a time by sync(), which compares each
+    topic's file version with the one it was indexed at, so only added,
+    changed and deleted topics are touched. Indexing reads topics with
+    ContentIndex.peek, so it doesn't leave the whole corpus parsed in the
+    content index (or decoded from a bundle) in every worker.
+    """
+
+    def __init__(self):
+        self._docs: Dict[int, SearchDoc] = {}
+        # term -> doc id -> term frequency
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._topic_docs: Dict[str, List[int]] = {}
+        # topic -> terms in its docs, to find its postings on removal
+        self._topic_terms: Dict[str, Set[str]] = {}
+        self._topic_versions: Dict[str, str] = {}
+        # The ContentIndex last synced from, to look hits up in
+        self._source = None
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove_topic(self, topic: str):
+        doc_ids = self._topic_docs.pop(topic, ())
+        for doc_id in doc_ids:
+            self._total_length -= self._docs.pop(doc_id).length
+        for term in self._topic_terms.pop(topic, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                for doc_id in doc_ids:
+                    postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._topic_versions.pop(topic, None)
+
+    def index_topic(self, topic: str, version: str, entry):
+        """
+        Replaces the documents for a topic with the blocks of its TopicEntry.
+        """
+        # An unclosed level section runs on to the end of the file, so a block
+        # can be in several; it belongs to the one opened last. Blocks left
+        # over in the whole-file table are outside any level section.
+        docs = []
+        claimed = Counter()
+        tables = [(level, table) for level, table in reversed(list(entry.by_level.items()))]
+        tables.append((None, entry.fallback))
+        for level, table in tables:
+            blocks = [(pref, position, block) for pref, pref_blocks in table.items() for position, block in enumerate(pref_blocks)]
+            remaining = Counter((b.type, b.body_md) for _, _, b in blocks) - claimed
+            for pref, position, block in blocks:
+                key = (block.type, block.body_md)
+                if remaining[key] > 0:
+                    remaining[key] -= 1
+                    claimed[key] += 1
+                    docs.append((level, block.type, (level, pref, position), Counter(tokenize(f"{block.title} {block.body_md}"))))
+
+        with self._lock:
+            self._remove_topic(topic)
+            doc_ids = []
+            terms = set()
+            for level, block_type, ref, counts in docs:
+                doc_id = self._next_id
+                self._next_id += 1
+                length = sum(counts.values())
+                self._docs[doc_id] = SearchDoc(topic, level, block_type, ref, length)
+                self._total_length += length
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                terms.update(counts)
+                doc_ids.append(doc_id)
+            self._topic_docs[topic] = doc_ids
+            self._topic_terms[topic] = terms
+            self._topic_versions[topic] = version
+
+    def remove_topic(self, topic: str):
+        with self._lock:
+            self._remove_topic(topic)
+
+    def sync(self, content_index):
+        """
+        Brings the index in line with a ContentIndex: indexes topics that are
+        new or whose version changed and drops topics that are gone.
+        """
+        self._source = content_index
+        current: Set[str] = set()
+        for topic in content_index.topics():
+            current.add(topic)
+            catalog_entry = content_index.catalog_entry(topic)
+            if catalog_entry is None:
+                continue
+            version = f"{catalog_entry.mtime_ns}-{catalog_entry.size}"
+            if self._topic_versions.get(topic) == version:
+                continue
+            entry = content_index.peek(topic)
+            if entry is not None:
+                self.index_topic(topic, entry.version, entry)
+        for topic in list(self._topic_versions):
+            if topic not in current:
+                self.remove_topic(topic)
+
+    def search(self, query: str, k: int = 10, level: Optional[str] = None, types: Optional[List[str]] = None) -> List[dict]:
+        """
+        Returns the top-k blocks for a query. Blocks outside any level section
+        match every level filter.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        level = level.lower() if level else None
+        types = set(types) if types else None
+
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    doc = self._docs[doc_id]
+                    if level is not None and doc.level is not None and doc.level != level:
+                        continue
+                    if types is not None and doc.type not in types:
+                        continue
+                    norm = tf + K1 * (1 - B + B * doc.length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / norm
+
+            top = [(self._docs[doc_id], score) for doc_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+            versions = {doc.topic: self._topic_versions.get(doc.topic) for doc, _ in top}
+
+        hits = []
+        entries = {}
+        for doc, score in top:
+            if doc.topic not in entries:
+                entry = self._source.get(doc.topic) if self._source is not None else None
+                # Changed since it was indexed; the next sync reindexes it
+                entries[doc.topic] = entry if entry is not None and entry.version == versions[doc.topic] else None
+            entry = entries[doc.topic]
+            if entry is None:
+                continue
+            block = entry.block(*doc.ref)
+            hits.append({
+                "topic": doc.topic,
+                "level": doc.level,
+                "type": block.type,
+                "title": block.title,
+                "body_md": block.body_md,
+                "score": round(score, 4),
+            })
+        return hits
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"topics": len(self._topic_docs), "docs": len(self._docs), "terms": len(self._postings)}
+
+# Shared by main and the routers
+search_index = SearchIndex()
@@ -0,0 +1,170 @@
+"""
+JWT signing keys shared by every worker process.
+
+Keys come from the JWT_KEYS environment variable (JSON, read-only) or from
+a keyring file, data_storage/jwt_keys.json by default (JWT_KEYRING_FILE).
+The file is created on first use, so tokens survive restarts and any worker
+on the host can verify a token signed by any other.
+
+    {"keys": [{"kid": "...", "secret": "...", "created_at": 1700000000,
+               "not_before": 1700000000, "retire_at": 1701000000}]}
+
+Tokens carry the signing key's kid in their header. A key verifies from
+created_at until retire_at and signs once not_before has passed. With a
+file keyring, the key in use is rotated every ROTATION_INTERVAL. The new
+key is published PUBLISH_AHEAD before it starts signing, so every worker
+has picked it up (they re-read the file every RELOAD_INTERVAL) by the time
+tokens signed with it appear. The old key keeps verifying until the
+longest-lived token it signed has expired.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; rotation there is best effort
+    fcntl = None
+
+KEYRING_FILE = os.environ.get(
+    "JWT_KEYRING_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_storage", "jwt_keys.json"),
+)
+
+ROTATION_INTERVAL = 7 * 24 * 3600
+PUBLISH_AHEAD = 10 * 60
+RELOAD_INTERVAL = 30
+# Longest token lifetime (refresh tokens) plus slack
+VERIFY_GRACE = 8 * 24 * 3600
+
+class SigningKey(NamedTuple):
+    kid: str
+    secret: str
+    created_at: float
+    not_before: float
+    retire_at: float
+
+def new_key(now: float, not_before: Optional[float] = None) -> SigningKey:
+    not_before = now if not_before is None else not_before
+    return SigningKey(
+        kid=secrets.token_hex(8),
+        secret=secrets.token_urlsafe(48),
+        created_at=now,
+        not_before=not_before,
+        # Provisional; pushed back when the next key takes over signing
+        retire_at=not_before + ROTATION_INTERVAL + VERIFY_GRACE,
+    )
+
+def parse_keys(data: dict) -> List[SigningKey]:
+    keys = []
+    for item in data.get("keys", []):
+        created_at = float(item.get("created_at", 0))
+        keys.append(SigningKey(
+            kid=str(item["kid"]),
+            secret=str(item["secret"]),
+            created_at=created_at,
+            not_before=float(item.get("not_before", created_at)),
+            retire_at=float(item.get("retire_at", float("inf"))),
+        ))
+    return keys
+
+class Keyring:
+    def __init__(self, path: str = KEYRING_FILE, env_value: Optional[str] = None):
+        self.path = path
+        self.env_value = env_value
+        self._keys: Dict[str, SigningKey] = {}
+        self._mtime_ns = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _read_file(self) -> List[SigningKey]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return parse_keys(json.load(f))
+
+    def _write_file(self, keys: List[SigningKey]):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"keys": [k._asdict() for k in keys]}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _locked_update(self, now: float):
+        # Creates the file or rotates its keys under an exclusive lock, so
+        # workers starting together agree on one set of keys
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            keys = self._read_file() if os.path.exists(self.path) else []
+            updated = self._rotate(keys, now)
+            if updated is not None:
+                self._write_file(updated)
+
+    @staticmethod
+    def _rotate(keys: List[SigningKey], now: float) -> Optional[List[SigningKey]]:
+        """
+        Returns the new key list, or None if nothing needs to change.
+        """
+        live = [k for k in keys if k.retire_at > now]
+        if not live:
+            return [new_key(now)]
+        newest = max(live, key=lambda k: k.not_before)
+        if now < newest.not_before + ROTATION_INTERVAL - PUBLISH_AHEAD and len(live) == len(keys):
+            return None
+        if now >= newest.not_before + ROTATION_INTERVAL - PUBLISH_AHEAD:
+            successor = new_key(now, not_before=max(now, newest.not_before + ROTATION_INTERVAL))
+            # Everything signed before the handover expires within the grace
+            live = [
+                k._replace(retire_at=min(k.retire_at, successor.not_before + VERIFY_GRACE))
+                for k in live
+            ]
+            live.append(successor)
+        return live
+
+    def _load(self, now: float):
+        if self.env_value:
+            if not self._keys:
+                self._keys = {k.kid: k for k in parse_keys(json.loads(self.env_value))}
+            return
+        if not os.path.exists(self.path) or self._rotate(self._read_file(), now) is not None:
+            self._locked_update(now)
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            self._keys = {k.kid: k for k in self._read_file()}
+            self._mtime_ns = mtime_ns
+
+    def _refresh(self):
+        now = time.time()
+        if now < self._next_check and self._keys:
+            return
+        with self._lock:
+            if now >= self._next_check or not self._keys:
+                self._load(now)
+                self._next_check = now + RELOAD_INTERVAL
+
+    def signing_key(self) -> SigningKey:
+        self._refresh()
+        now = time.time()
+        usable = [k for k in self._keys.values() if k.not_before <= now < k.retire_at]
+        if not usable:
+            raise RuntimeError("No active JWT signing key")
+        return max(usable, key=lambda k: k.not_before)
+
+    def verification_key(self, kid: Optional[str]) -> Optional[SigningKey]:
+        self._refresh()
+        key = self._keys.get(kid) if kid else None
+        if key is None or key.retire_at <= time.time():
+            return None
+        return key
+
+    def kids(self) -> List[str]:
+        self._refresh()
+        return list(self._keys)
+
+keyring = Keyring(env_value=os.environ.get("JWT_KEYS"))
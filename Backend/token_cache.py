@@ -0,0 +1,83 @@
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Mapping, Optional, Tuple
+
+def token_digest(token: str) -> bytes:
+    # Keys are digests so the cache never holds usable tokens
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+class TokenCache:
+    """
+    Bounded cache of verified JWT payloads, keyed by token digest.
+
+    An entry lives until the token's exp. When full, already-expired entries
+    go first (from a heap ordered by exp), then the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[bytes, Tuple[Mapping, float]]" = OrderedDict()
+        # (exp, digest); may hold stale pairs for entries already gone
+        self._expiries: List[Tuple[float, bytes]] = []
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Mapping]:
+        digest = token_digest(token)
+        with self._lock:
+            cached = self._entries.get(digest)
+            if cached is None:
+                self.misses += 1
+                return None
+            payload, exp = cached
+            if exp <= time.time():
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: Mapping, exp: float):
+        digest = token_digest(token)
+        with self._lock:
+            if digest not in self._entries:
+                self._make_room(time.time())
+            self._entries[digest] = (payload, exp)
+            self._entries.move_to_end(digest)
+            heapq.heappush(self._expiries, (exp, digest))
+
+    def _make_room(self, now: float):
+        # Drop everything already expired, then LRU entries if still full
+        while self._expiries and self._expiries[0][0] <= now:
+            exp, digest = heapq.heappop(self._expiries)
+            cached = self._entries.get(digest)
+            if cached is not None and cached[1] == exp:
+                del self._entries[digest]
+                self.evictions += 1
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        # Keep the heap from filling up with pairs for LRU-evicted entries
+        if len(self._expiries) > 2 * self.max_entries:
+            self._expiries = [(exp, digest) for digest, (_, exp) in self._entries.items()]
+            heapq.heapify(self._expiries)
+
+    def discard(self, token: str):
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+# Compact once the log grows past this many bytes
+COMPACT_THRESHOLD_BYTES = 4 * 1024 * 1024
+# How long the flusher waits for more mutations before a group commit
+FLUSH_INTERVAL = 0.005
+# Seconds between retries of a compaction that failed
+COMPACT_RETRY_INTERVAL = 60.0
+
+class LogStore:
+    """
+    Log-structured store for a dict of JSON records.
+
+    The state is a snapshot file (a plain JSON object, as users.json has
+    always been) plus an append-only log with one JSON line per mutation.
+    A mutation costs one appended line, whatever the number of records.
+
+    Once the log passes compact_threshold bytes it is rotated to
+    "<log>.compacting" and a background thread folds it into a new snapshot,
+    written to a temp file and atomically renamed over the old one. Replaying
+    a log on top of a snapshot that already contains it is harmless, so a
+    crash at any point of compaction loses nothing. A compaction left
+    unfinished by a crash is completed on open; one that failed is retried
+    (every COMPACT_RETRY_INTERVAL at most) before the log rotates again.
+
+    Writes are group-committed: put() and delete() queue the line and return
+    a Future, and a single flusher thread writes everything queued during
+    the last flush_interval with one fsync, then resolves the Futures.
+
+    The store assumes it is the only writer: records are read once on open
+    and the log is rotated by rename, so a second process appending to the
+    same files would go unseen or be lost. Run one worker per store.
+    """
+
+    def __init__(self, snapshot_path: str, log_path: str, compact_threshold: int = COMPACT_THRESHOLD_BYTES, flush_interval: float = FLUSH_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compacting_path = f"{log_path}.compacting"
+        self.compact_threshold = compact_threshold
+        self.flush_interval = flush_interval
+        self._log = None
+        self._log_size = 0
+        self._pending: List[Tuple[str, Future, float]] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._flusher: Optional[threading.Thread] = None
+        self._compactor: Optional[threading.Thread] = None
+        self._compact_failed_at: Optional[float] = None
+        # Group commit metrics
+        self.flushes = 0
+        self.records = 0
+        self.max_batch = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.commit_wait_seconds = 0.0
+        self.max_commit_wait_seconds = 0.0
+
+    @staticmethod
+    def _replay(records: Dict[str, dict], path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r+", encoding="utf-8") as f:
+            good_end = 0
+            for line in f:
+                if not line.endswith("\n"):
+                    # Torn write from a crash; drop it so new appends start clean
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print(f"Skipping corrupt record in {path}")
+                else:
+                    if entry["op"] == "put":
+                        records[entry["key"]] = entry["value"]
+                    elif entry["op"] == "del":
+                        records.pop(entry["key"], None)
+                good_end += len(line.encode("utf-8"))
+            f.truncate(good_end)
+
+    def _read_snapshot(self) -> Dict[str, dict]:
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_snapshot(self, records: Dict[str, dict]):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def load(self, initial: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Returns the current records: the snapshot (seeded from initial if
+        there is none) with any unfinished compaction and the log replayed.
+        """
+        if os.path.exists(self.snapshot_path):
+            records = self._read_snapshot()
+        else:
+            records = dict(initial)
+            self._write_snapshot(records)
+        if os.path.exists(self.compacting_path):
+            # Left by a crash or a failed compaction: finish it now
+            self._replay(records, self.compacting_path)
+            self._write_snapshot(records)
+            os.remove(self.compacting_path)
+        self._replay(records, self.log_path)
+
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log_size = self._log.tell()
+        self._closing = False
+        self._flusher = threading.Thread(target=self._run_flusher, name="log-flusher", daemon=True)
+        self._flusher.start()
+        return records
+
+    def _append(self, entry: dict) -> Future:
+        # Serialised now, so later changes to the caller's dict don't leak in
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        future = Future()
+        with self._cond:
+            if self._closing or self._flusher is None:
+                raise RuntimeError(f"{self.log_path} is not open")
+            self._pending.append((line, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def put(self, key: str, value) -> Future:
+        """
+        Queues a put; the Future resolves once it is on disk.
+        """
+        return self._append({"op": "put", "key": key, "value": value})
+
+    def delete(self, key: str) -> Future:
+        return self._append({"op": "del", "key": key})
+
+    def _run_flusher(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            if self.flush_interval > 0 and not self._closing:
+                # Let concurrent writers join this commit
+                time.sleep(self.flush_interval)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[str, Future, float]]):
+        started = time.perf_counter()
+        try:
+            data = "".join(line for line, _, _ in batch)
+            self._log.write(data)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log_size += len(data.encode("utf-8"))
+            if self._log_size >= self.compact_threshold:
+                self._rotate()
+        except Exception as e:
+            print(f"Flush of {self.log_path} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        flush_seconds = done - started
+        self.flushes += 1
+        self.records += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.flush_seconds += flush_seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, flush_seconds)
+        for _, future, queued in batch:
+            wait = done - queued
+            self.commit_wait_seconds += wait
+            self.max_commit_wait_seconds = max(self.max_commit_wait_seconds, wait)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        flushes = self.flushes or 1
+        records = self.records or 1
+        return {
+            "flushes": self.flushes,
+            "records": self.records,
+            "pending": len(self._pending),
+            "avg_batch": round(self.records / flushes, 2),
+            "max_batch": self.max_batch,
+            "avg_flush_ms": round(self.flush_seconds / flushes * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+            "avg_commit_wait_ms": round(self.commit_wait_seconds / records * 1000, 3),
+            "max_commit_wait_ms": round(self.max_commit_wait_seconds * 1000, 3),
+            "log_bytes": self._log_size,
+        }
+
+    def _rotate(self):
+        # Called from the flusher thread. If the last compaction is still
+        # running, keep appending and try again on a later flush.
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.compacting_path):
+            # The last compaction failed; retry it, and rotate once it is done
+            if self._compact_failed_at is None or time.monotonic() - self._compact_failed_at >= COMPACT_RETRY_INTERVAL:
+                self._start_compaction()
+            return
+        self._log.close()
+        os.replace(self.log_path, self.compacting_path)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log_size = 0
+        self._start_compaction()
+
+    def _start_compaction(self):
+        self._compactor = threading.Thread(target=self._compact, name="log-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact(self):
+        # Works only from files, so writers are never blocked on it
+        try:
+            records = self._read_snapshot()
+            self._replay(records, self.compacting_path)
+            self._write_snapshot(records)
+            os.remove(self.compacting_path)
+            self._compact_failed_at = None
+        except Exception as e:
+            self._compact_failed_at = time.monotonic()
+            print(f"Compaction of {self.log_path} failed: {e}")
+
+    def close(self):
+        """
+        Flushes anything still queued and closes the log.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self._compactor is not None:
+            self._compactor.join()
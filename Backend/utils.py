@@ -1,127 +1,220 @@
 import re
 import os
-from typing import List, Dict
+import hashlib
+from typing import List, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
 from models import ContentBlock
+from answer_key import answer_key
 
-def parse_markdown_content(file_path: str, level: str, preferences: List[str]) -> List[ContentBlock]:
+BLOCK_MAPPINGS = {
+    "examples": (r"<!-- examples:start -->", r"<!-- examples:end -->"),
+    "practice_problems": (r"<!-- practice:start -->", r"<!-- practice:end -->"),
+    "step_by_step": (r"<!-- steps:start -->", r"<!-- steps:end -->"),
+    "visuals": (r"<!-- visuals:start -->", r"<!-- visuals:end -->"),
+    "test_cases": (r"<!-- testcases:start -->", r"<!-- testcases:end -->"),
+    "complexity": (r"<!-- complexity:start -->", r"<!-- complexity:end -->"),
+    "summary": (r"<!-- summary:start -->", r"<!-- summary:end -->"),
+    "interactive": (r"<!-- interactive:start -->", r"<!-- interactive:end -->"),
+    "analogies": (r"<!-- analogies:start -->", r"<!-- analogies:end -->"),
+    "pitfalls": (r"<!-- pitfalls:start -->", r"<!-- pitfalls:end -->"),
+    "challenge": (r"<!-- challenge:start -->", r"<!-- challenge:end -->"),
+    "gif_walkthrough": (r"<!-- gif:start -->", r"<!-- gif:end -->"),
+    "post_read_quiz": (r"<!-- postquiz:start -->", r"<!-- postquiz:end -->"),
+    # Code tags (allows for headers inside the block)
+    "code_python": (r"<!-- code_python:start -->", r"<!-- code_python:end -->"),
+    "code_java": (r"<!-- code_java:start -->", r"<!-- code_java:end -->"),
+    "code_cpp": (r"<!-- code_cpp:start -->", r"<!-- code_cpp:end -->"),
+}
+
+# Code blocks are special: if no tags are found we fall back to fenced code
+CODE_MAPPINGS = {
+    "code_python": "python",
+    "code_java": "java",
+    "code_cpp": "cpp"
+}
+
+# Tag name inside the marker ("practice" in <!-- practice:start -->) -> preference
+TAG_PREFS = {start_tag[5:start_tag.index(":")]: pref for pref, (start_tag, _) in BLOCK_MAPPINGS.items()}
+
+# Matches both level markers (<!-- level:beginner -->, case-insensitive) and
+# block tags (<!-- examples:start -->, case-sensitive, checked after matching)
+_MARKER = re.compile(r"<!-- (\w+):(\w+) -->", re.IGNORECASE)
+_FENCE_OPEN = {pref: re.compile(f"```?{lang}") for pref, lang in CODE_MAPPINGS.items()}
+
+class ScanEvent(NamedTuple):
+    # Lower-cased level whose <!-- level:x --> ... <!-- level:end --> section the
+    # block was found in, or None for a block found scanning the whole file.
+    # When block is None the event marks the end of that level's section.
+    section: Optional[str]
+    block: Optional[ContentBlock]
+    # True for blocks found via the ```lang fallback rather than tags
+    fenced: bool = False
+
+class _BlockScanner:
     """
-    Parses a markdown file and extracts blocks based on level and preferences.
+    Tag and fence state for one region of a file (the whole file or one level
+    section). Text is fed in document order and finished blocks are appended
+    to events.
     """
-    if not os.path.exists(file_path):
-        return []
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    def __init__(self, section: Optional[str], events: List[ScanEvent]):
+        self.section = section
+        self.events = events
+        self.tagged: Dict[str, List[str]] = {}
+        self.fenced: Dict[str, List[str]] = {}
 
-    blocks = []
-    
-    # This is a simplified parser. In a real app, we might need a more robust one.
-    # We assume blocks are marked like <!-- type:start --> ... <!-- type:end -->
-    # and code blocks are ```lang ... ```
-    
-    # Map preferences to regex patterns or logic
-    # For now, let's implement a basic extraction based on the prompt's block mapping
-    
-    block_mappings = {
-        "examples": (r"<!-- examples:start -->", r"<!-- examples:end -->"),
-        "practice_problems": (r"<!-- practice:start -->", r"<!-- practice:end -->"),
-        "step_by_step": (r"<!-- steps:start -->", r"<!-- steps:end -->"),
-        "visuals": (r"<!-- visuals:start -->", r"<!-- visuals:end -->"),
-        "test_cases": (r"<!-- testcases:start -->", r"<!-- testcases:end -->"),
-        "complexity": (r"<!-- complexity:start -->", r"<!-- complexity:end -->"),
-        "summary": (r"<!-- summary:start -->", r"<!-- summary:end -->"),
-        "interactive": (r"<!-- interactive:start -->", r"<!-- interactive:end -->"),
-        "analogies": (r"<!-- analogies:start -->", r"<!-- analogies:end -->"),
-        "pitfalls": (r"<!-- pitfalls:start -->", r"<!-- pitfalls:end -->"),
-        "challenge": (r"<!-- challenge:start -->", r"<!-- challenge:end -->"),
-        "gif_walkthrough": (r"<!-- gif:start -->", r"<!-- gif:end -->"),
-        "post_read_quiz": (r"<!-- postquiz:start -->", r"<!-- postquiz:end -->"),
-    }
-
-    # Code blocks are special
-    code_mappings = {
-        "code_python": "python",
-        "code_java": "java",
-        "code_cpp": "cpp"
-    }
-
-    # First, let's try to filter by level if the file has level-specific sections
-    # If the file is structured with level headers, we might need to extract that section first.
-    # For this MVP, let's assume the file content is already appropriate for the level 
-    # OR that we pass the level to filter specific level blocks if they exist.
-    # The prompt says "markdown files split by level and block tags", which implies 
-    # we might have `Binary Trees_Beginner.md` or sections. 
-    # Let's assume separate files for simplicity or a single file with all content.
-    # Given the prompt "Render only selected content blocks for the assigned level",
-    # let's assume we look for a file named `{Topic}_{Level}.md` first.
-    
-    # Filter content by level if level tags exist
-    level_pattern = re.compile(f"<!-- level:{level.lower()} -->(.*?)<!-- level:end -->", re.DOTALL | re.IGNORECASE)
-    level_match = level_pattern.search(content)
-    
-    if level_match:
-        # If level tags are found, only process the content within that level's block
-        content_to_process = level_match.group(1)
-    else:
-        # If no level tags found, assume the file is generic or specific to this level already
-        # (Or we could return empty if we want to be strict)
-        content_to_process = content
+    def feed(self, text: str):
+        for parts in self.tagged.values():
+            parts.append(text)
+        if "``" in text or self.fenced:
+            self._feed_fences(text)
 
-    # Extended block mappings to include code tags if the user uses them (allows for headers inside)
-    block_mappings.update({
-        "code_python": (r"<!-- code_python:start -->", r"<!-- code_python:end -->"),
-        "code_java": (r"<!-- code_java:start -->", r"<!-- code_java:end -->"),
-        "code_cpp": (r"<!-- code_cpp:start -->", r"<!-- code_cpp:end -->"),
-    })
+    def feed_tag(self, marker: str, pref: str, action: str):
+        if action == "start" and pref not in self.tagged:
+            # Marker text belongs to the other open blocks, not this one
+            self.feed(marker)
+            self.tagged[pref] = []
+        elif action == "end" and pref in self.tagged:
+            parts = self.tagged.pop(pref)
+            self.feed(marker)
+            block = ContentBlock(type=pref, title=pref.replace("_", " ").title(), body_md="".join(parts).strip())
+            self.events.append(ScanEvent(self.section, block))
+        else:
+            self.feed(marker)
 
-    processed_prefs = set()
+    def _feed_fences(self, text: str):
+        closed = []
+        for pref, opener in _FENCE_OPEN.items():
+            pos = 0
+            while True:
+                if pref not in self.fenced:
+                    m = opener.search(text, pos)
+                    if not m:
+                        break
+                    self.fenced[pref] = []
+                    pos = m.end()
+                else:
+                    end = text.find("```", pos)
+                    if end < 0:
+                        self.fenced[pref].append(text[pos:])
+                        break
+                    parts = self.fenced.pop(pref)
+                    parts.append(text[pos:end])
+                    closed.append((end, pref, "".join(parts)))
+                    pos = end + 3
+        # Fences of different languages can close on the same line
+        for _, pref, body in sorted(closed, key=lambda c: c[0]):
+            lang = CODE_MAPPINGS[pref]
+            block = ContentBlock(type=pref, title=f"{lang.capitalize()} Code", body_md=f"```{lang}\n{body.strip()}\n```")
+            self.events.append(ScanEvent(self.section, block, True))
 
-    for pref in preferences:
-        if pref in block_mappings:
-            start_tag, end_tag = block_mappings[pref]
-            pattern = re.compile(f"{re.escape(start_tag)}(.*?){re.escape(end_tag)}", re.DOTALL)
-            matches = pattern.findall(content_to_process)
-            if matches:
-                processed_prefs.add(pref)
-                for match in matches:
-                    # If it's a code block from tags, we use the tag name as title or derive it
-                    title = pref.replace("_", " ").title()
-                    if "Code" in title and "Code" not in title.replace("Code", ""): # Avoid "Code Code"
-                         pass 
-                    blocks.append(ContentBlock(type=pref, title=title, body_md=match.strip()))
-        
-        # Fallback for code blocks if no tags were found
-        if pref in code_mappings and pref not in processed_prefs:
-            lang = code_mappings[pref]
-            pattern = re.compile(f"```?{lang}(.*?)```", re.DOTALL)
-            matches = pattern.findall(content_to_process)
-            for match in matches:
-                blocks.append(ContentBlock(type=pref, title=f"{lang.capitalize()} Code", body_md=f"```{lang}\n{match.strip()}\n```"))
+def normalize_preferences(preferences: Iterable[str]) -> List[str]:
+    """
+    Known block types only, each once, in the order first given. Unknown
+    ones match no block, so dropping them doesn't change what is served.
+    """
+    return list(dict.fromkeys(pref for pref in preferences if pref in BLOCK_MAPPINGS))
 
+def iter_blocks(lines: Iterable[str]) -> Iterator[ScanEvent]:
+    """
+    Walks a topic file once, line by line, and yields its blocks in document order.
+
+    Every tagged block and every ```python/java/cpp fence is yielded once for
+    the whole file and once more for the level section it sits in, if any.
+    Only blocks that are still open are kept in memory.
+    """
+    events: List[ScanEvent] = []
+    scanners = [_BlockScanner(None, events)]
+    seen_levels = set()
+
+    for line in lines:
+        if "<!--" not in line:
+            for scanner in scanners:
+                scanner.feed(line)
+        else:
+            pos = 0
+            for m in _MARKER.finditer(line):
+                text = line[pos:m.start()]
+                for scanner in scanners:
+                    scanner.feed(text)
+                pos = m.end()
+                marker, name, action = m.group(0), m.group(1), m.group(2)
+
+                if name.lower() == "level":
+                    level = action.lower()
+                    if level == "end" and len(scanners) > 1:
+                        # Closes every section opened since the last level:end
+                        for scanner in scanners[1:]:
+                            events.append(ScanEvent(scanner.section, None))
+                        del scanners[1:]
+                    for scanner in scanners:
+                        scanner.feed(marker)
+                    if level != "end" and level not in seen_levels:
+                        # Only the first section of each level counts
+                        seen_levels.add(level)
+                        scanners.append(_BlockScanner(level, events))
+                    continue
+
+                pref = TAG_PREFS.get(name)
+                for scanner in scanners:
+                    if pref is not None:
+                        scanner.feed_tag(marker, pref, action)
+                    else:
+                        scanner.feed(marker)
+            text = line[pos:]
+            for scanner in scanners:
+                scanner.feed(text)
+
+        if events:
+            yield from events
+            events.clear()
+
+def select_blocks(events: Iterable[ScanEvent], level: str, preferences: List[str]) -> List[ContentBlock]:
+    """
+    Picks the blocks for a level and set of preferences out of a scan, in
+    preference order.
+
+    If the file has a <!-- level:{level} --> ... <!-- level:end --> section only
+    blocks inside it are used, otherwise the whole file is. Tagged code blocks
+    take precedence over bare ```lang fences.
+    """
+    level = level.lower()
+    wanted = set(preferences)
+    found = {None: {}, level: {}}
+    section_closed = False
+
+    for event in events:
+        if event.block is None:
+            if event.section == level:
+                section_closed = True
+                # The rest of the file can no longer be needed
+                break
+            continue
+        if event.block.type in wanted and event.section in found:
+            found[event.section].setdefault((event.block.type, event.fenced), []).append(event.block)
+
+    table = found[level] if section_closed else found[None]
+    blocks = []
+    for pref in preferences:
+        blocks.extend(table.get((pref, False)) or table.get((pref, True), []))
     return blocks
 
-def calculate_score(answers: List[Dict]) -> float:
-    """
-    Calculates the score based on answers.
-    Simple implementation: 1 point per correct answer.
-    """
-    # In a real app, we'd check against a key. 
-    # For this MVP, let's assume we have a way to validate.
-    # Since we don't have a database of correct answers yet, 
-    # let's mock the correctness for the demo or assume the client sends correctness?
-    # No, backend should validate.
-    # Let's add a simple answer key mechanism or mock it.
-    
-    # Mock logic: If selected option is 'A', it's correct (just for MVP flow if no key provided)
-    # OR better, we define the key in the questions data.
-    
-    correct_count = 0
-    for ans in answers:
-        # Placeholder logic
-        if ans.selected == "A": 
-            correct_count += 1
-            
-    return correct_count / len(answers) if answers else 0
+def parse_markdown_content(file_path: str, level: str, preferences: List[str]) -> List[ContentBlock]:
+    """
+    Parses a markdown file and extracts blocks based on level and preferences.
+    """
+    if not os.path.exists(file_path):
+        return []
+
+    # We assume blocks are marked like <!-- type:start --> ... <!-- type:end -->
+    # and code blocks are ```lang ... ```
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return select_blocks(iter_blocks(f), level, preferences)
+
+def grade_answers(topic: str, answers: List) -> List[bool]:
+    """
+    Whether each answer matches the topic's compiled answer key.
+    """
+    return [answer_key.is_correct(topic, ans.q_id, ans.selected) for ans in answers]
 
 def determine_category(score: float) -> str:
     if score >= 0.8:
@@ -130,3 +223,27 @@ def determine_category(score: float) -> str:
         return "Intermediate"
     else:
         return "Beginner"
+
+def make_etag(*parts) -> str:
+    """
+    Builds a strong ETag from the parts that determine a response body.
+    """
+    digest = hashlib.blake2b("\0".join(str(p) for p in parts).encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an If-None-Match header against an ETag (weak comparison, as
+    RFC 7232 requires for If-None-Match).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
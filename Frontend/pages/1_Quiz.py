@@ -26,11 +26,38 @@ if "questions" not in st.session_state:
         st.error("Backend is not running. Please start the FastAPI backend.")
         st.stop()
 
-if "current_q_index" not in st.session_state:
-    st.session_state.current_q_index = 0
-    st.session_state.answers = []
+if "quiz_session_id" not in st.session_state:
+    # Answers are kept server-side; starting again resumes an unfinished quiz
+    response = st.session_state.api_session.post(f"{API_URL}/quiz-sessions", json={"topic": st.session_state.topic})
+    if response.status_code != 200:
+        st.error("Failed to start the quiz.")
+        st.stop()
+    quiz_session = response.json()
+    st.session_state.quiz_session_id = quiz_session["session_id"]
+    answered = set(quiz_session["answered"])
+    st.session_state.current_q_index = next(
+        (i for i, q in enumerate(st.session_state.questions) if q["id"] not in answered),
+        len(st.session_state.questions),
+    )
     st.session_state.start_time = time.time()
 
+def finish_quiz(session_url):
+    try:
+        res = st.session_state.api_session.post(f"{session_url}/finish")
+        if res.status_code == 200:
+            del st.session_state.quiz_session_id
+            result = res.json()
+            st.session_state.score = result["score"]
+            st.session_state.category = result["category"]
+            st.session_state.breakdown = result["breakdown"]
+            st.success("Quiz Submitted!")
+            time.sleep(1)
+            st.switch_page("pages/2_Results.py")
+        else:
+            st.error("Submission failed.")
+    except Exception as e:
+        st.error(f"Error submitting quiz: {e}")
+
 questions = st.session_state.questions
 current_index = st.session_state.current_q_index
 
@@ -50,39 +77,27 @@ if current_index < len(questions):
     if st.button("Next" if current_index < len(questions) - 1 else "Submit"):
         # Record answer
         elapsed = time.time() - st.session_state.start_time
-        st.session_state.answers.append({
+        session_url = f"{API_URL}/quiz-sessions/{st.session_state.quiz_session_id}"
+        res = st.session_state.api_session.post(f"{session_url}/answers", json={
             "q_id": q["id"],
             "selected": option,
             "time": elapsed,
             "confidence": confidence
         })
+        if res.status_code != 200:
+            st.error("Failed to save your answer. Please try again.")
+            st.stop()
         
         if current_index < len(questions) - 1:
             st.session_state.current_q_index += 1
             st.session_state.start_time = time.time() # Reset timer for next question
             st.rerun()
         else:
-            # Submit quiz
-            payload = {
-                "user_id": st.session_state.user["username"], # Use actual username
-                "topic": st.session_state.topic,
-                "answers": st.session_state.answers
-            }
-            
-            try:
-                res = st.session_state.api_session.post(f"{API_URL}/submit", json=payload)
-                if res.status_code == 200:
-                    result = res.json()
-                    st.session_state.score = result["score"]
-                    st.session_state.category = result["category"]
-                    st.session_state.breakdown = result["breakdown"]
-                    st.success("Quiz Submitted!")
-                    time.sleep(1)
-                    st.switch_page("pages/2_Results.py")
-                else:
-                    st.error("Submission failed.")
-            except Exception as e:
-                st.error(f"Error submitting quiz: {e}")
+            finish_quiz(session_url)
 
 else:
-    st.write("Quiz completed.")
+    # Every answer is saved but the quiz wasn't submitted (e.g. a reload or a
+    # failed submit); it stays open until finished
+    st.write("All questions answered.")
+    if st.button("Submit"):
+        finish_quiz(f"{API_URL}/quiz-sessions/{st.session_state.quiz_session_id}")
@@ -1,6 +1,6 @@
 import streamlit as st
 import requests
-from utils import init_api_session
+from utils import init_api_session, stream_with_etag
 
 API_URL = "http://127.0.0.1:8000/api"
 
@@ -41,28 +41,28 @@ with col_sidebar:
     st.session_state.selected_preferences = selected_prefs
 
 with col_content:
-    # Fetch content
-    payload = {
+    # Stream content so blocks render as they arrive (revalidated with ETag,
+    # so reruns reuse the last body)
+    params = {
         "topic": st.session_state.topic,
         "level": st.session_state.category,
         "preferences": st.session_state.selected_preferences
     }
     
     try:
-        response = st.session_state.api_session.post(f"{API_URL}/content", json=payload)
-        if response.status_code == 200:
-            data = response.json()
-            blocks = data.get("blocks", [])
-            
-            if not blocks:
-                st.info("No content matches your specific preferences for this topic.")
-            
+        status_code, blocks = stream_with_etag(f"{API_URL}/content/stream", params=params)
+        if status_code == 200:
+            rendered = 0
             for block in blocks:
                 with st.container():
                     st.subheader(block["title"])
                     st.markdown(block["body_md"])
                     st.divider()
-        elif response.status_code == 401:
+                rendered += 1
+
+            if not rendered:
+                st.info("No content matches your specific preferences for this topic.")
+        elif status_code == 401:
              st.error("Session expired. Please login again.")
         else:
             st.error("Failed to load content.")
@@ -1,3 +1,4 @@
+import json
 import requests
 import streamlit as st
 
@@ -84,4 +85,53 @@ def init_session():
 
 def init_api_session():
     if "api_session" not in st.session_state:
-        st.session_state.api_session = requests.Session()
+        session = requests.Session()
+        # Every call reaches the API from this server, so pass on the
+        # browser's address for the API's per-IP rate limits
+        ip = getattr(getattr(st, "context", None), "ip_address", None)
+        if ip:
+            session.headers["X-Forwarded-For"] = ip
+        st.session_state.api_session = session
+
+def _etag_cache_key(url, params):
+    return (url, tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (params or {}).items())))
+
+def stream_with_etag(url, params=None):
+    """
+    GET a newline-delimited JSON endpoint through the session's api_session,
+    revalidating with If-None-Match against the last body seen for the same
+    URL and params.
+    Returns (status_code, iterator over the decoded items); on 200 the items
+    are yielded as they arrive and cached once the stream is complete, and a
+    304 is reported as 200 with the cached items.
+    """
+    init_api_session()
+    if "etag_cache" not in st.session_state:
+        st.session_state.etag_cache = {}
+    cache = st.session_state.etag_cache
+
+    key = _etag_cache_key(url, params)
+    cached = cache.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+
+    response = st.session_state.api_session.get(url, params=params, headers=headers, stream=True)
+    if response.status_code == 304 and cached:
+        response.close()
+        return 200, iter(cached[1])
+    if response.status_code != 200:
+        response.close()
+        return response.status_code, iter(())
+
+    def items():
+        received = []
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    item = json.loads(line)
+                    received.append(item)
+                    yield item
+        etag = response.headers.get("ETag")
+        if etag:
+            cache[key] = (etag, received)
+
+    return 200, items()